@@ -0,0 +1,261 @@
+"""
+Benchmarks for the tracker's valuation, persistence and fetch paths.
+
+Runs against a local stub of the CoinGecko API (and a local tick replay server for the
+streaming source), so no network access is needed:
+
+    python benchmark.py --sizes 10,1000,100000 --output results.json
+    python benchmark.py --compare results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from crypto_tracker import (CryptoTracker, JsonStorage, SqliteStorage, PortfolioRollup, PortfolioValuation,
+                            ReplayServer, StreamingSource, TokenBucket, UI)
+
+
+def stub_price(crypto_id: str) -> float:
+    # Deterministic across runs, unlike hash()
+    return 1 + zlib.crc32(crypto_id.encode()) % 100000 / 10
+
+
+class StubCoinGecko(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    requests_served = 0
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, data, status: int = 200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        StubCoinGecko.requests_served += 1
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path.endswith('/simple/price'):
+            currencies = query['vs_currencies'][0].split(',')
+            data = {}
+            for crypto_id in query['ids'][0].split(','):
+                price = stub_price(crypto_id)
+                quote = {}
+                for currency in currencies:
+                    quote[currency] = price
+                    quote[f'{currency}_24h_change'] = 1.5
+                    quote[f'{currency}_market_cap'] = price * 1e6
+                data[crypto_id] = quote
+            self.send_json(data)
+        elif url.path.endswith('/coins/list'):
+            self.send_json([{'id': f'coin-{i}', 'symbol': f'c{i}', 'name': f'Coin {i}'} for i in range(1000)])
+        elif url.path.endswith('/search'):
+            self.send_json({'coins': []})
+        else:
+            self.send_json({}, 404)
+
+
+def start_stub(handler=StubCoinGecko) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def synthetic_portfolio(size: int) -> Dict:
+    return {
+        f'coin-{i}': {'amount': 1 + i % 17 / 4, 'avg_price': stub_price(f'coin-{i}') * 0.9, 'added': '2024-01-01'}
+        for i in range(size)
+    }
+
+
+def timed(fn: Callable, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+        # UI messages are buffered per frame; nothing will ever show them here
+        UI._frame = []
+    return samples
+
+
+def result(name: str, size: int, samples: List[float], ops: Optional[int] = None) -> Dict:
+    best = min(samples)
+    return {
+        'name': name,
+        'size': size,
+        'min_seconds': best,
+        'median_seconds': statistics.median(samples),
+        'ops_per_second': (ops / best) if ops and best > 0 else None,
+        'repeat': len(samples)
+    }
+
+
+def make_tracker(directory: str, api_base: str, storage=None) -> CryptoTracker:
+    tracker = CryptoTracker(storage or JsonStorage(directory), api_base=api_base)
+    # The stub has no rate limit; measure our own overhead, not the public API's throttle
+    tracker.fetcher.limiter = TokenBucket(rate=1e6, capacity=10**6)
+    # Every configured currency is quoted and recorded on each fetch, as in real use
+    tracker.price_cache.max_entries = 10**7
+    return tracker
+
+
+def bench_size(size: int, api_base: str, repeat: int) -> List[Dict]:
+    results = []
+    portfolio = synthetic_portfolio(size)
+
+    with tempfile.TemporaryDirectory() as directory:
+        tracker = make_tracker(directory, api_base)
+        tracker.portfolio = portfolio
+
+        # End-to-end refresh: batched fetch, cache fill and valuation. The history and price cache
+        # writes it triggers are debounced; they are drained before every sample and timed on their own
+        tracker.writes.delay = 3600
+        refresh, writes = [], []
+        for _ in range(repeat):
+            tracker.writes.flush()
+            start = time.perf_counter()
+            tracker.value_portfolio(refresh=True).rows()
+            refresh.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            tracker.writes.flush()
+            writes.append(time.perf_counter() - start)
+        UI._frame = []
+        results.append(result('refresh_end_to_end', size, refresh, size))
+        results.append(result('refresh_deferred_writes', size, writes, size * len(tracker.currencies)))
+
+        # display_portfolio-equivalent valuation from cached quotes
+        prices = tracker.get_prices(list(portfolio))
+        samples = timed(lambda: PortfolioValuation.from_prices(portfolio, prices).rows(), repeat)
+        results.append(result('valuation', size, samples, size))
+
+        # The same holdings spread over 20 accounts, valued as one rollup
+        accounts = {f'account-{n}': {} for n in range(20)}
+        for i, (crypto_id, holding) in enumerate(portfolio.items()):
+            accounts[f'account-{i % 20}'][crypto_id] = holding
+        samples = timed(lambda: PortfolioRollup(accounts, prices).rows(), repeat)
+        results.append(result('rollup_20_portfolios', size, samples, size))
+
+        for label, storage in (('json', tracker.storage), ('sqlite', SqliteStorage(os.path.join(directory, 'bench.db')))):
+            samples = timed(lambda: storage.save_holdings('bench', portfolio), repeat)
+            results.append(result(f'save_portfolio_{label}', size, samples, size))
+            samples = timed(lambda: storage.load_holdings('bench'), repeat)
+            results.append(result(f'load_portfolio_{label}', size, samples, size))
+
+        # add_holding with the quote already cached, so this measures bookkeeping and the (coalesced) ledger write
+        adds = min(size, 5000)
+        ids = list(portfolio)[:adds]
+        for label, storage in (('json', JsonStorage(directory)), ('sqlite', SqliteStorage(os.path.join(directory, 'adds.db')))):
+            adder = make_tracker(directory, api_base, storage)
+            adder.get_prices(ids)
+
+            def add_all():
+                for crypto_id in ids:
+                    adder.add_holding(crypto_id, 1.0)
+                adder.flush()
+
+            samples = timed(add_all, repeat)
+            results.append(result(f'add_holding_{label}', adds, samples, adds))
+    return results
+
+
+def bench_stream(ticks: int, repeat: int) -> List[Dict]:
+    """Ingest rate of the streaming source, fed by the replay server at full speed"""
+    with tempfile.TemporaryDirectory() as directory:
+        ticks_file = os.path.join(directory, 'ticks.jsonl')
+        with open(ticks_file, 'w') as f:
+            for i in range(ticks):
+                f.write(json.dumps({'id': f'coin-{i % 1000}', 'currency': 'usd', 'price': stub_price(f'coin-{i % 1000}'),
+                                    'change_24h': 1.5, 'ts': i / 1000}) + '\n')
+        server = ReplayServer(ticks_file, speed=0).start()
+
+        def consume():
+            source = StreamingSource(server.url, reconnect=60).start()
+            while source.ticks < ticks:
+                time.sleep(0.001)
+            source.close()
+
+        samples = timed(consume, repeat)
+        server.close()
+    return [result('stream_ingest', ticks, samples, ticks)]
+
+
+def compare(results: List[Dict], baseline_file: str, threshold: float) -> List[str]:
+    with open(baseline_file, 'r') as f:
+        baseline = {(row['name'], row['size']): row for row in json.load(f)['results']}
+    regressions = []
+    for row in results:
+        before = baseline.get((row['name'], row['size']))
+        if before and row['min_seconds'] > before['min_seconds'] * (1 + threshold):
+            change = (row['min_seconds'] / before['min_seconds'] - 1) * 100
+            regressions.append(f"{row['name']} (n={row['size']}): {before['min_seconds']:.4f}s -> "
+                               f"{row['min_seconds']:.4f}s (+{change:.0f}%)")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the crypto tracker against a local API stub")
+    parser.add_argument('--sizes', default='10,1000,100000', help="comma-separated portfolio sizes")
+    parser.add_argument('--ticks', type=int, default=100000, help="ticks replayed for the streaming benchmark")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark (best and median reported)")
+    parser.add_argument('--output', help="write results JSON here instead of stdout")
+    parser.add_argument('--compare', help="baseline results JSON to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown before flagging, e.g. 0.25")
+    args = parser.parse_args(argv)
+
+    UI.configure(color=False)
+    server = start_stub()
+    api_base = f"http://127.0.0.1:{server.server_address[1]}/api/v3"
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        print(f"benchmarking {size} holdings...", file=sys.stderr)
+        results.extend(bench_size(size, api_base, args.repeat))
+    if args.ticks:
+        print(f"benchmarking {args.ticks} streamed ticks...", file=sys.stderr)
+        results.extend(bench_stream(args.ticks, args.repeat))
+    server.shutdown()
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'stub_requests': StubCoinGecko.requests_served,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,12 +2,116 @@
 Author: Saurabh Kumar Singh
 """
 
+import argparse
+import atexit
+import contextlib
+import io
+import csv
+import functools
+import sys
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import asyncio
 import json
+import math
+import random
+import re
 from datetime import datetime
 import time
+import bisect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 import os
-from typing import Dict, Optional, List
+import shutil
+import socket
+import socketserver
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, List, Tuple, Union
+
+API_BASE = os.environ.get('COINGECKO_API', "https://api.coingecko.com/api/v3")
+
+# CoinGecko /simple/price batching limits
+MAX_IDS_PER_REQUEST = 250
+MAX_IDS_LENGTH = 1800
+
+# Price cache defaults
+PRICE_CACHE_TTL = 60
+PRICE_CACHE_SIZE = 5000
+PRICE_STALE_GRACE = 300  # serve expired quotes this long while revalidating in the background
+PRICE_KEEP_STALE = 7 * 24 * 60 * 60  # last known quotes kept this long for offline use
+
+# Request rate limiting (CoinGecko public API allows roughly 30 calls/minute)
+RATE_LIMIT_PER_SEC = 0.5
+RATE_LIMIT_BURST = 5
+MAX_CONCURRENT_REQUESTS = 4
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+# Pooled HTTP session defaults
+HTTP_POOL_SIZE = 8
+HTTP_TIMEOUT = 10
+HTTP_CONNECT_TIMEOUT = 3.05
+
+# Circuit breaker: consecutive failures before tripping, seconds before a trial request
+BREAKER_THRESHOLD = 3
+BREAKER_RESET = 30
+
+# Transaction ledger compaction interval (appends between snapshots)
+LEDGER_COMPACT_EVERY = 1000
+
+# Durability of local writes: 'always' also fsyncs every ledger append, 'snapshots' fsyncs
+# whole-file rewrites only, 'never' leaves flushing to the OS. Rewrites are atomic regardless.
+FSYNC_ENV = 'CRYPTO_TRACKER_FSYNC'
+FSYNC_POLICIES = ('always', 'snapshots', 'never')
+WRITE_DEBOUNCE = 0.5  # seconds of holdings changes collected into one write
+
+DEFAULT_PORTFOLIO = 'default'
+# Portfolio names become part of file names, so no path separators
+PORTFOLIO_NAME_PATTERN = re.compile(r'[A-Za-z0-9_.-]+')
+
+SUPPORTED_CURRENCIES = ('usd', 'inr', 'eur', 'gbp')
+
+# Streaming price feed: ticks older than STREAM_MAX_AGE seconds fall back to polling
+STREAM_ENV = 'CRYPTO_TRACKER_STREAM'
+STREAM_MAX_AGE = 30
+STREAM_RECONNECT = 2
+STREAM_WATCH_INTERVAL = 0.5
+STREAM_WARMUP = 1.0  # one-shot commands wait this long for the feed's first quotes
+
+# Local HTTP API (serve subcommand)
+SERVER_PORT = 8080
+
+# Local price history (per-coin float64 column files)
+HISTORY_DIR = 'price_history'
+
+# Live watch refresh interval in seconds
+WATCH_INTERVAL = 15
+
+# Local coin search index built from /coins/list
+COIN_INDEX_FILE = 'coin_index.json'
+COIN_INDEX_MAX_AGE = 24 * 60 * 60
+
+# Alert polling interval in seconds, and the pseudo coin id used for portfolio-value rules
+ALERT_INTERVAL = 60
+PORTFOLIO_KEY = '__portfolio__'
+
+# Monte Carlo goal projection: paths, days of history fitted, minimum daily returns per coin,
+# simulation step length in days and paths simulated per batch
+PROJECTION_PATHS = 100000
+PROJECTION_LOOKBACK = 365
+PROJECTION_MIN_DAYS = 30
+PROJECTION_STEP_DAYS = 7
+PROJECTION_CHUNK = 25000
+
+# Opt-in profiling: set to a file path (.json for JSON, anything else for Prometheus text)
+METRICS_ENV = 'CRYPTO_TRACKER_METRICS'
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
 
 class Colors:
     RESET = '\033[0m'
@@ -19,163 +123,2826 @@ class Colors:
     GRAY = '\033[90m'
     BLACK = '\033[30m'
     
-    # Accent colors
-    GREEN = '\033[92m'
-    RED = '\033[91m'
-    BLUE = '\033[94m'
-    CYAN = '\033[96m'
-    YELLOW = '\033[93m'
+    # Accent colors
+    GREEN = '\033[92m'
+    RED = '\033[91m'
+    BLUE = '\033[94m'
+    CYAN = '\033[96m'
+    YELLOW = '\033[93m'
+    
+    @classmethod
+    def disable(cls):
+        for name in ('RESET', 'BOLD', 'DIM', 'WHITE', 'GRAY', 'BLACK', 'GREEN', 'RED', 'BLUE', 'CYAN', 'YELLOW'):
+            setattr(cls, name, '')
+
+class Metrics:
+    """Opt-in latency histograms and counters, exportable as Prometheus text or JSON"""
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.enabled = False
+        self.buckets = buckets
+        self.histograms: Dict[str, List] = {}
+        self.counters: Dict[Tuple[str, str], float] = {}
+        self.sources: Dict[str, object] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, op: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            # [per-bucket counts..., +Inf count, sum]
+            hist = self.histograms.setdefault(op, [0] * (len(self.buckets) + 1) + [0.0])
+            hist[bisect.bisect_left(self.buckets, seconds)] += 1
+            hist[-1] += seconds
+    
+    def inc(self, name: str, label: str = '', amount: float = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[(name, label)] = self.counters.get((name, label), 0) + amount
+    
+    @contextlib.contextmanager
+    def timer(self, op: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('errors', op)
+            raise
+        finally:
+            self.observe(op, time.perf_counter() - start)
+    
+    def gauges(self) -> Dict[str, float]:
+        values = {}
+        for prefix, source in self.sources.items():
+            for key, value in source().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values[f"{prefix}_{key}"] = value
+        return values
+    
+    def to_json(self) -> Dict:
+        with self._lock:
+            histograms = {}
+            for op, hist in self.histograms.items():
+                count = sum(hist[:-1])
+                histograms[op] = {
+                    'count': count,
+                    'sum_seconds': hist[-1],
+                    'mean_seconds': hist[-1] / count if count else 0.0,
+                    'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], hist[:-1]))
+                }
+            counters = {}
+            for (name, label), value in self.counters.items():
+                counters.setdefault(name, {})[label or 'total'] = value
+        return {'histograms': histograms, 'counters': counters, 'gauges': self.gauges()}
+    
+    def to_prometheus(self) -> str:
+        lines = ['# TYPE crypto_tracker_op_seconds histogram']
+        with self._lock:
+            for op, hist in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip([str(b) for b in self.buckets] + ['+Inf'], hist[:-1]):
+                    cumulative += count
+                    lines.append(f'crypto_tracker_op_seconds_bucket{{op="{op}",le="{bound}"}} {cumulative}')
+                lines.append(f'crypto_tracker_op_seconds_sum{{op="{op}"}} {hist[-1]}')
+                lines.append(f'crypto_tracker_op_seconds_count{{op="{op}"}} {cumulative}')
+            counters = sorted(self.counters.items())
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f'# TYPE crypto_tracker_{name}_total counter')
+            for (counter, label), value in counters:
+                if counter == name:
+                    tag = f'{{op="{label}"}}' if label else ''
+                    lines.append(f'crypto_tracker_{name}_total{tag} {value}')
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f'# TYPE crypto_tracker_{name} gauge')
+            lines.append(f'crypto_tracker_{name} {value}')
+        return '\n'.join(lines) + '\n'
+    
+    def dump(self, path: str):
+        with open(path, 'w') as f:
+            if path.endswith('.json'):
+                json.dump(self.to_json(), f, indent=2)
+            else:
+                f.write(self.to_prometheus())
+
+
+METRICS = Metrics()
+
+
+def instrumented(op: str):
+    """Record call latency and errors for `op` while profiling is enabled"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return fn(*args, **kwargs)
+            with METRICS.timer(op):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class UI:
+    """Composes each screen in a buffer and writes it to stdout in one flush"""
+    
+    _frame: List[str] = []
+    color = True
+    
+    @staticmethod
+    def configure(color: Optional[bool] = None):
+        # Default to plain output when piped or when NO_COLOR is set
+        if color is None:
+            color = sys.stdout.isatty() and 'NO_COLOR' not in os.environ
+        UI.color = color
+        if not color:
+            Colors.disable()
+    
+    @staticmethod
+    def write(text: str = ''):
+        UI._frame.append(text)
+    
+    @staticmethod
+    @instrumented('render_flush')
+    def flush():
+        if UI._frame:
+            frame, UI._frame = UI._frame, []
+            sys.stdout.write('\n'.join(frame) + '\n')
+        sys.stdout.flush()
+    
+    @staticmethod
+    def pause(seconds: float):
+        UI.flush()
+        time.sleep(seconds)
+    
+    @staticmethod
+    def clear():
+        # Anything not yet shown belongs to the screen being replaced
+        UI._frame = []
+        if UI.color:
+            sys.stdout.write('\033[H\033[2J\033[3J')
+    
+    @staticmethod
+    def age(seconds: float) -> str:
+        for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+            if seconds >= size:
+                return f"{int(seconds // size)}{unit}"
+        return f"{int(seconds)}s"
+    
+    @staticmethod
+    def line(char='─', length=60):
+        return char * length
+    
+    @staticmethod
+    def header(text: str):
+        UI.write()
+        UI.write(f"{Colors.BOLD}{Colors.WHITE}{text.center(60)}{Colors.RESET}")
+        UI.write(f"{Colors.GRAY}{UI.line()}{Colors.RESET}")
+        UI.write()
+    
+    @staticmethod
+    def section(text: str):
+        UI.write(f"\n{Colors.BOLD}{Colors.WHITE}{text}{Colors.RESET}")
+        UI.write(f"{Colors.GRAY}{UI.line('─', len(text))}{Colors.RESET}")
+    
+    @staticmethod
+    def info(label: str, value: str, color: Optional[str] = None):
+        color = Colors.WHITE if color is None else color
+        UI.write(f"{Colors.GRAY}{label:<20}{Colors.RESET}{color}{value}{Colors.RESET}")
+    
+    @staticmethod
+    def success(message: str):
+        UI.write(f"{Colors.GREEN}✓{Colors.RESET} {message}")
+    
+    @staticmethod
+    def error(message: str):
+        UI.write(f"{Colors.RED}✗{Colors.RESET} {message}")
+    
+    @staticmethod
+    def prompt(message: str) -> str:
+        UI.flush()
+        return input(f"{Colors.CYAN}› {Colors.RESET}{message} ")
+    
+    @staticmethod
+    def menu_item(number: Union[int, str], text: str, description: str = ""):
+        num = f"{Colors.BOLD}{Colors.WHITE}{number}{Colors.RESET}"
+        title = f"{Colors.WHITE}{text}{Colors.RESET}"
+        desc = f"{Colors.GRAY}{description}{Colors.RESET}" if description else ""
+        UI.write(f"  {num}  {title}")
+        if desc:
+            UI.write(f"     {desc}")
+    
+    @staticmethod
+    def divider():
+        UI.write(f"{Colors.GRAY}{UI.line()}{Colors.RESET}")
+    
+    @staticmethod
+    def space(lines=1):
+        UI.write('\n' * (lines - 1))
+
+
+class PriceCache:
+    """LRU price cache keyed by (coin id, currency) with TTL and an optional storage backend.
+    
+    Expired quotes are kept (up to keep_stale seconds) so they can still be served,
+    clearly marked, while revalidating or when the API is unreachable.
+    """
+    
+    def __init__(self, ttl: float = PRICE_CACHE_TTL, max_entries: int = PRICE_CACHE_SIZE, store=None,
+                 keep_stale: float = PRICE_KEEP_STALE):
+        self.ttl = ttl
+        self.keep_stale = keep_stale
+        self.max_entries = max_entries
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.load()
+    
+    def get(self, crypto_id: str, currency: str) -> Optional[Dict]:
+        key = (crypto_id, currency)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def get_stale(self, crypto_id: str, currency: str) -> Optional[Tuple[Dict, float]]:
+        """Last known quote regardless of TTL, with its age in seconds"""
+        key = (crypto_id, currency)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            age = time.time() - entry[0]
+            if age > self.keep_stale:
+                del self._entries[key]
+                return None
+            self.stale_hits += 1
+            return entry[1], age
+    
+    def put(self, crypto_id: str, currency: str, quote: Dict, fetched_at: Optional[float] = None):
+        key = (crypto_id, currency)
+        with self._lock:
+            self._entries[key] = (fetched_at or time.time(), quote)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0
+        }
+    
+    def load(self):
+        if not self.store:
+            return
+        try:
+            now = time.time()
+            for crypto_id, currency, fetched_at, quote in self.store.load_prices():
+                if now - fetched_at <= self.keep_stale:
+                    self.put(crypto_id, currency, quote, fetched_at)
+        except (OSError, ValueError, TypeError, sqlite3.Error):
+            pass
+    
+    def persist(self):
+        if not self.store:
+            return
+        with self._lock:
+            rows = [[key[0], key[1], fetched_at, quote] for key, (fetched_at, quote) in self._entries.items()]
+        try:
+            self.store.save_prices(rows)
+        except (OSError, sqlite3.Error):
+            pass
+
+
+class TokenBucket:
+    """Async token-bucket limiter that backs off on 429s and recovers on success"""
+    
+    def __init__(self, rate: float = RATE_LIMIT_PER_SEC, capacity: int = RATE_LIMIT_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 16
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        # Shared by fetches running on several threads' event loops
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        while True:
+            with self._lock:
+                wait = self.blocked_until - time.monotonic()
+                if wait <= 0:
+                    self._refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+    
+    def throttled(self, retry_after: Optional[float] = None):
+        # Multiplicative decrease, and honour the server's Retry-After if given
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+    
+    def succeeded(self):
+        # Additive increase back towards the configured rate
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class AsyncPriceFetcher:
+    """Issues API requests concurrently under a shared TokenBucket"""
+    
+    def __init__(self, get=requests.get, limiter: Optional[TokenBucket] = None,
+                 concurrency: int = MAX_CONCURRENT_REQUESTS, max_retries: int = MAX_RETRIES,
+                 timeout=HTTP_TIMEOUT):
+        self.get = get
+        self.limiter = limiter or TokenBucket()
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.last_elapsed = 0.0
+    
+    def fetch_all(self, url: str, param_sets: List[Dict]) -> List:
+        """Run every request concurrently; returns JSON bodies or exceptions in order"""
+        start = time.perf_counter()
+        try:
+            return asyncio.run(self._gather(url, param_sets))
+        finally:
+            self.last_elapsed = time.perf_counter() - start
+    
+    async def _gather(self, url: str, param_sets: List[Dict]) -> List:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def run(params):
+            async with semaphore:
+                return await self._fetch(url, params)
+        
+        return await asyncio.gather(*(run(params) for params in param_sets), return_exceptions=True)
+    
+    async def _fetch(self, url: str, params: Dict):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            waited = time.perf_counter()
+            await self.limiter.acquire()
+            METRICS.observe('rate_limit_wait', time.perf_counter() - waited)
+            self.requests += 1
+            try:
+                response = await loop.run_in_executor(
+                    self.executor, lambda: self.get(url, params=params, timeout=self.timeout))
+            except (requests.ConnectionError, requests.Timeout):
+                # A dead or unresponsive API is the circuit breaker's call; retrying here only multiplies the timeout
+                raise
+            except requests.RequestException:
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code == 429:
+                    self.throttled += 1
+                    self.limiter.throttled(self._retry_after(response))
+                elif response.status_code >= 500 and attempt < self.max_retries:
+                    pass
+                else:
+                    self.limiter.succeeded()
+                    response.raise_for_status()
+                    with METRICS.timer('json_parse'):
+                        return response.json()
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt))
+    
+    @staticmethod
+    def _retry_after(response) -> Optional[float]:
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+    
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+    
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'retries': self.retries,
+            'current_rate': self.limiter.rate,
+            'last_elapsed': self.last_elapsed
+        }
+
+
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    """Fails fast after repeated connection failures, letting one trial call through per reset period"""
+    
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_after: float = BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return 'half-open'
+        return 'open'
+    
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'half-open':
+                # Admit a single trial request; re-arm the timer for everyone else
+                self.opened_at = time.monotonic()
+                return True
+            return state == 'closed'
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    self.trips += 1
+                self.opened_at = time.monotonic()
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution whose result every caller shares.
+    
+    Counters are per key: `executed` keys were computed, `shared` lookups were served by
+    another caller's in-flight work instead of going upstream themselves.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict = {}
+        self.executed = 0
+        self.shared = 0
+    
+    def do_many(self, keys: List, fn) -> Dict:
+        """Keys nobody is working on are computed together by fn(keys) -> {key: result}; keys already
+        in flight are waited for. Keys missing from a result are missing from the return value."""
+        waiting = []
+        with self._lock:
+            call = {'done': threading.Event(), 'result': {}, 'error': None}
+            leading = []
+            for key in dict.fromkeys(keys):
+                other = self._calls.get(key)
+                if other is None:
+                    self._calls[key] = call
+                    leading.append(key)
+                else:
+                    waiting.append((key, other))
+            self.executed += len(leading)
+            self.shared += len(waiting)
+        
+        results = {}
+        if leading:
+            try:
+                call['result'] = fn(leading)
+            except Exception as e:
+                call['error'] = e
+                raise
+            finally:
+                with self._lock:
+                    for key in leading:
+                        del self._calls[key]
+                call['done'].set()
+            results.update(call['result'])
+        
+        # Our own share is published before waiting, so two overlapping batches cannot wait on each other
+        for key, other in waiting:
+            other['done'].wait()
+            if other['error'] is not None:
+                raise other['error']
+            if key in other['result']:
+                results[key] = other['result'][key]
+        return results
+    
+    def stats(self) -> Dict:
+        return {'executed': self.executed, 'shared': self.shared, 'in_flight': len(self._calls)}
+
+
+class ApiClient:
+    """Keep-alive HTTP session shared by every call to the CoinGecko API"""
+    
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, timeout: float = HTTP_TIMEOUT,
+                 retries: int = 2, backoff_factor: float = 0.5, breaker: Optional[CircuitBreaker] = None):
+        self.timeout = (HTTP_CONNECT_TIMEOUT, timeout)
+        self.breaker = breaker or CircuitBreaker()
+        self.requests = 0
+        self.session = requests.Session()
+        # 429s are left to the TokenBucket and dead connections to the breaker; only transient server errors retry here
+        # (urllib3 would otherwise also retry any 429 that carries a Retry-After header)
+        retry = Retry(total=retries, connect=0, read=0, backoff_factor=backoff_factor,
+                      status_forcelist=[500, 502, 503, 504], allowed_methods=['GET'],
+                      respect_retry_after_header=False, raise_on_status=False)
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+    
+    def get(self, url: str, params: Optional[Dict] = None, timeout=None):
+        if not self.breaker.allow():
+            raise CircuitOpenError("API unreachable, retrying shortly")
+        self.requests += 1
+        op = 'http ' + urlparse(url).path.split('/api/v3', 1)[-1]
+        METRICS.inc('http_requests', op)
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, params=params, timeout=timeout or self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            METRICS.inc('http_timeouts' if isinstance(e, requests.Timeout) else 'http_errors', op)
+            self.breaker.record_failure()
+            raise
+        finally:
+            METRICS.observe(op, time.perf_counter() - start)
+        if response.status_code >= 400:
+            METRICS.inc('http_errors', f"{op} {response.status_code}")
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+    
+    def stats(self) -> Dict:
+        pools = self.adapter.poolmanager.pools
+        connections = sum(pools[key].num_connections for key in list(pools.keys()))
+        return {
+            'requests': self.requests,
+            'connections_opened': connections,
+            'connections_reused': max(0, self.requests - connections),
+            'reuse_rate': max(0.0, 1 - connections / self.requests) if self.requests else 0.0,
+            'breaker': self.breaker.state,
+            'breaker_trips': self.breaker.trips
+        }
+    
+    def close(self):
+        self.session.close()
+
+
+class PriceSource:
+    """Where CryptoTracker.get_prices gets quotes: `quotes` returns what it has for the ids, possibly a subset"""
+    
+    def quotes(self, crypto_ids: List[str], currency: str) -> Dict[str, Dict]:
+        raise NotImplementedError
+    
+    def stats(self) -> Dict:
+        return {}
+    
+    def close(self):
+        pass
+
+
+class PollingSource(PriceSource):
+    """Pull quotes on demand, e.g. CoinGecko /simple/price via CryptoTracker._fetch_quotes"""
+    
+    def __init__(self, fetch):
+        self.fetch = fetch
+    
+    def quotes(self, crypto_ids: List[str], currency: str) -> Dict[str, Dict]:
+        return self.fetch(crypto_ids, currency)
+
+
+class StreamingSource(PriceSource):
+    """Consume a push feed of ticks into an in-memory latest-quote table.
+    
+    The feed is newline-delimited JSON over TCP (tcp://host:port), one tick per line:
+    {"id": "bitcoin", "currency": "usd", "price": 43000.5, "change_24h": 1.2, "market_cap": 8.4e11}.
+    Other feeds (an exchange ticker socket bridged to lines, a different message shape)
+    plug in through `parse`. Lookups never block on the network; ticks older than
+    `max_age` are ignored so the caller falls back to polling.
+    """
+    
+    def __init__(self, url: str, parse=None, max_age: float = STREAM_MAX_AGE,
+                 reconnect: float = STREAM_RECONNECT, record: Optional[str] = None):
+        address = urlparse(url)
+        if address.scheme != 'tcp' or not address.port:
+            raise ValueError(f"unsupported stream url: {url} (expected tcp://host:port)")
+        self.url = url
+        self.address = (address.hostname, address.port)
+        self.parse = parse or self.parse_tick
+        self.max_age = max_age
+        self.reconnect = reconnect
+        self.record = record
+        self.latest: Dict[Tuple[str, str], Tuple[Dict, float]] = {}
+        self.ticks = 0
+        self.errors = 0
+        self.connects = 0
+        self.connected = threading.Event()
+        self._stop = threading.Event()
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+    
+    @staticmethod
+    def parse_tick(message: Dict) -> Optional[Tuple[str, str, Dict]]:
+        return message['id'], message.get('currency', 'usd'), {
+            'price': float(message['price']),
+            'change_24h': message.get('change_24h') or 0,
+            'market_cap': message.get('market_cap') or 0
+        }
+    
+    def start(self) -> 'StreamingSource':
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+    
+    def _run(self):
+        recorder = open(self.record, 'ab') if self.record else None
+        try:
+            while not self._stop.is_set():
+                try:
+                    with socket.create_connection(self.address, timeout=HTTP_CONNECT_TIMEOUT) as sock:
+                        sock.settimeout(None)
+                        self._sock = sock
+                        self.connects += 1
+                        self.connected.set()
+                        for line in sock.makefile('rb'):
+                            self.ingest(line)
+                            if recorder:
+                                recorder.write(line)
+                except OSError:
+                    pass
+                finally:
+                    self._sock = None
+                    self.connected.clear()
+                self._stop.wait(self.reconnect)
+        finally:
+            if recorder:
+                recorder.close()
+    
+    def ingest(self, line: bytes):
+        try:
+            tick = self.parse(json.loads(line))
+        except (ValueError, KeyError, TypeError):
+            self.errors += 1
+            return
+        if tick:
+            crypto_id, currency, quote = tick
+            self.latest[(crypto_id, currency)] = (quote, time.time())
+            self.ticks += 1
+    
+    def quotes(self, crypto_ids: List[str], currency: str) -> Dict[str, Dict]:
+        now = time.time()
+        prices = {}
+        for crypto_id in crypto_ids:
+            entry = self.latest.get((crypto_id, currency))
+            if entry and now - entry[1] <= self.max_age:
+                prices[crypto_id] = entry[0]
+        return prices
+    
+    def wait_for(self, crypto_ids: List[str], currency: str, timeout: float = STREAM_WARMUP) -> bool:
+        """Give a just-started feed a moment to deliver quotes for `crypto_ids`"""
+        deadline = time.monotonic() + timeout
+        while len(self.quotes(crypto_ids, currency)) < len(set(crypto_ids)):
+            if time.monotonic() >= deadline or self._stop.is_set():
+                return False
+            time.sleep(0.01)
+        return True
+    
+    def stats(self) -> Dict:
+        return {
+            'ticks': self.ticks,
+            'errors': self.errors,
+            'connects': self.connects,
+            'connected': int(self.connected.is_set()),
+            'symbols': len(self.latest)
+        }
+    
+    def close(self):
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            with contextlib.suppress(OSError):
+                sock.shutdown(socket.SHUT_RDWR)
+        if self._thread:
+            self._thread.join(timeout=2)
+
+
+class ReplayServer:
+    """Plays a recorded tick file (one JSON tick per line) to every client that connects.
+    
+    Ticks carrying a 'ts' are paced by their recorded spacing divided by `speed`;
+    speed 0 sends as fast as the socket takes them, for throughput tests.
+    """
+    
+    def __init__(self, ticks_file: str, host: str = '127.0.0.1', port: int = 0, speed: float = 1.0,
+                 loop: bool = False):
+        self.ticks_file = ticks_file
+        self.speed = speed
+        self.loop = loop
+        self.sent = 0
+        self.skipped = 0
+        replay = self
+        
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with contextlib.suppress(OSError):
+                    replay.play(self.request)
+        
+        class Server(socketserver.ThreadingTCPServer):
+            # Restarting on the same port shouldn't wait out TIME_WAIT
+            allow_reuse_address = True
+            daemon_threads = True
+        
+        self.server = Server((host, port), Handler)
+    
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"tcp://{host}:{port}"
+    
+    def play(self, sock: socket.socket):
+        while True:
+            started, first_ts = time.monotonic(), None
+            batch: List[bytes] = []
+            with open(self.ticks_file, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if self.speed > 0:
+                        try:
+                            ts = json.loads(line).get('ts')
+                        except (ValueError, AttributeError):
+                            # Malformed tick: skip it, as StreamingSource.ingest would
+                            self.skipped += 1
+                            continue
+                        if ts is not None:
+                            first_ts = ts if first_ts is None else first_ts
+                            delay = started + (ts - first_ts) / self.speed - time.monotonic()
+                            if delay > 0:
+                                sock.sendall(b''.join(batch))
+                                batch = []
+                                time.sleep(delay)
+                    batch.append(line if line.endswith(b'\n') else line + b'\n')
+                    self.sent += 1
+                    if len(batch) >= 512:
+                        sock.sendall(b''.join(batch))
+                        batch = []
+            sock.sendall(b''.join(batch))
+            if not self.loop:
+                return
+    
+    def start(self) -> 'ReplayServer':
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+    
+    def serve_forever(self):
+        self.server.serve_forever()
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PortfolioValuation:
+    """Vectorized per-holding and total P/L over parallel NumPy arrays"""
+    
+    def __init__(self, ids: List[str], amounts, avg_prices, prices, changes_24h,
+                 currency: str = 'usd', unpriced: Optional[List[str]] = None,
+                 stale: Optional[Dict[str, float]] = None):
+        self.ids = list(ids)
+        self.currency = currency
+        self.unpriced = unpriced or []
+        self.stale = stale or {}
+        self.amounts = np.asarray(amounts, dtype=np.float64)
+        self.avg_prices = np.asarray(avg_prices, dtype=np.float64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.changes_24h = np.asarray(changes_24h, dtype=np.float64)
+        
+        self.value = self.amounts * self.prices
+        self.invested = self.amounts * self.avg_prices
+        self.profit = self.value - self.invested
+        self.profit_pct = np.divide(self.profit * 100, self.invested,
+                                    out=np.zeros_like(self.profit), where=self.invested > 0)
+        
+        self.total_value = float(self.value.sum())
+        self.total_invested = float(self.invested.sum())
+        self.total_profit = self.total_value - self.total_invested
+        self.total_profit_pct = (self.total_profit / self.total_invested * 100) if self.total_invested > 0 else 0
+        self.weights = self.value / self.total_value if self.total_value > 0 else np.zeros_like(self.value)
+        
+        # Value 24h ago implied by the percentage change, and each holding's share of the move
+        growth = 1 + self.changes_24h / 100
+        previous = np.divide(self.value, growth, out=np.zeros_like(self.value), where=growth > 0)
+        self.change_24h_value = self.value - previous
+        self.total_change_24h = float(self.change_24h_value.sum())
+        previous_total = float(previous.sum())
+        self.total_change_24h_pct = (self.total_change_24h / previous_total * 100) if previous_total > 0 else 0
+    
+    @classmethod
+    def from_prices(cls, portfolio: Dict, prices: Dict[str, Dict], currency: str = 'usd') -> 'PortfolioValuation':
+        ids = [crypto_id for crypto_id in portfolio if crypto_id in prices]
+        return cls(
+            ids,
+            [portfolio[crypto_id]['amount'] for crypto_id in ids],
+            [portfolio[crypto_id]['avg_price'] for crypto_id in ids],
+            [prices[crypto_id]['price'] for crypto_id in ids],
+            [prices[crypto_id]['change_24h'] or 0 for crypto_id in ids],
+            currency=currency,
+            unpriced=[crypto_id for crypto_id in portfolio if crypto_id not in prices],
+            stale={crypto_id: prices[crypto_id]['age'] for crypto_id in ids if prices[crypto_id].get('stale')}
+        )
+    
+    def rows(self) -> List[Dict]:
+        columns = zip(self.ids, self.amounts.tolist(), self.avg_prices.tolist(), self.prices.tolist(),
+                      self.changes_24h.tolist(), self.value.tolist(), self.invested.tolist(),
+                      self.profit.tolist(), self.profit_pct.tolist(), self.weights.tolist(),
+                      self.change_24h_value.tolist())
+        keys = ('id', 'amount', 'avg_price', 'current_price', 'change_24h', 'value', 'invested',
+                'profit', 'profit_pct', 'weight', 'change_24h_value')
+        rows = [dict(zip(keys, row)) for row in columns]
+        for row in rows:
+            row['quote_age'] = self.stale.get(row['id'])
+        return rows
+    
+    def summary(self) -> Dict:
+        return {
+            'currency': self.currency,
+            'total_value': self.total_value,
+            'total_invested': self.total_invested,
+            'total_profit': self.total_profit,
+            'total_profit_pct': self.total_profit_pct,
+            'total_change_24h': self.total_change_24h,
+            'total_change_24h_pct': self.total_change_24h_pct,
+            'unpriced': self.unpriced,
+            'stale': self.stale
+        }
+
+
+class PortfolioRollup:
+    """Several portfolios valued together: a (portfolios x coins) amount matrix against one price vector"""
+    
+    def __init__(self, holdings: Dict[str, Dict], prices: Dict[str, Dict], currency: str = 'usd'):
+        self.names = list(holdings)
+        self.currency = currency
+        all_ids = list(dict.fromkeys(crypto_id for portfolio in holdings.values() for crypto_id in portfolio))
+        self.ids = [crypto_id for crypto_id in all_ids if crypto_id in prices]
+        self.unpriced = [crypto_id for crypto_id in all_ids if crypto_id not in prices]
+        self.stale = {crypto_id: prices[crypto_id]['age'] for crypto_id in self.ids if prices[crypto_id].get('stale')}
+        
+        column = {crypto_id: i for i, crypto_id in enumerate(self.ids)}
+        self.amounts = np.zeros((len(self.names), len(self.ids)))
+        self.invested_by_coin = np.zeros_like(self.amounts)
+        for row, name in enumerate(self.names):
+            for crypto_id, holding in holdings[name].items():
+                if crypto_id in column:
+                    self.amounts[row, column[crypto_id]] = holding['amount']
+                    self.invested_by_coin[row, column[crypto_id]] = holding['amount'] * holding['avg_price']
+        self.prices = np.array([prices[crypto_id]['price'] for crypto_id in self.ids], dtype=np.float64)
+        self.changes_24h = np.array([prices[crypto_id]['change_24h'] or 0 for crypto_id in self.ids], dtype=np.float64)
+        
+        self.value = (self.amounts * self.prices).sum(axis=1)
+        self.invested = self.invested_by_coin.sum(axis=1)
+        self.profit = self.value - self.invested
+        self.profit_pct = np.divide(self.profit * 100, self.invested,
+                                    out=np.zeros_like(self.profit), where=self.invested > 0)
+        total = self.value.sum()
+        self.weights = self.value / total if total > 0 else np.zeros_like(self.value)
+        
+        # Every account's holdings merged into one position per coin, cost-weighted
+        amounts = self.amounts.sum(axis=0)
+        avg_prices = np.divide(self.invested_by_coin.sum(axis=0), amounts, out=np.zeros_like(amounts),
+                               where=amounts > 0)
+        self.combined = PortfolioValuation(self.ids, amounts, avg_prices, self.prices, self.changes_24h,
+                                           currency, self.unpriced, self.stale)
+    
+    def rows(self) -> List[Dict]:
+        holdings = (self.amounts > 0).sum(axis=1)
+        columns = zip(self.names, holdings.tolist(), self.value.tolist(), self.invested.tolist(),
+                      self.profit.tolist(), self.profit_pct.tolist(), self.weights.tolist())
+        keys = ('portfolio', 'holdings', 'value', 'invested', 'profit', 'profit_pct', 'weight')
+        return [dict(zip(keys, row)) for row in columns]
+    
+    def summary(self) -> Dict:
+        return dict(self.combined.summary(), portfolios=self.rows())
+
+
+def atomic_write(path: str, write, fsync: bool = True, backup: bool = False):
+    """Replace `path` with what write(f) produces; readers and crashes see the old file or the new one, never half.
+    
+    With `backup` the replaced version stays available as path + '.bak' for recovery.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    # Unique per writer so concurrent saves of the same file cannot share a temp file
+    tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, 'w') as f:
+            write(f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if backup and os.path.exists(path):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path + '.bak')
+            try:
+                os.link(path, path + '.bak')
+            except OSError:
+                shutil.copyfile(path, path + '.bak')
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        # Make the rename itself durable
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def set_aside(path: str) -> str:
+    """Move an unreadable file out of the way (never delete it) and return its new name"""
+    kept = stem = f"{path}.corrupt-{datetime.now():%Y%m%d-%H%M%S}"
+    n = 1
+    while os.path.exists(kept):
+        n += 1
+        kept = f"{stem}-{n}"
+    os.replace(path, kept)
+    return kept
+
+
+class WriteBehind:
+    """Collect writes for up to `delay` seconds and run the latest one per key.
+    
+    A burst of add_holding calls becomes one disk write. flush() runs everything pending
+    now; it is called before reads that must see the writes, and at exit. A write that
+    fails stays pending for the next flush without holding up writes for other keys.
+    """
+    
+    def __init__(self, delay: float = WRITE_DEBOUNCE):
+        self.delay = delay
+        self._pending: Dict = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+        self.requested = 0
+        self.written = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+        atexit.register(self._flush_at_exit)
+    
+    def schedule(self, key, write):
+        with self._lock:
+            self._pending[key] = write
+            self.requested += 1
+            if self.delay <= 0:
+                self.flush()
+            elif self._timer is None:
+                # Not restarted by later calls, so a steady stream of changes still lands every `delay`
+                self._timer = threading.Timer(self.delay, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+    
+    def flush(self):
+        """Run every pending write; the first failure is raised once the others have been attempted"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            errors = []
+            for key, write in list(self._pending.items()):
+                try:
+                    write()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                del self._pending[key]
+                self.written += 1
+            if errors:
+                self.failed += len(errors)
+                self.last_error = str(errors[0])
+                raise errors[0]
+    
+    def _flush_in_background(self):
+        # Failures stay pending; the next change or explicit flush retries and reports them
+        with contextlib.suppress(Exception):
+            self.flush()
+    
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Could not save pending changes: {e}", file=sys.stderr)
+    
+    def stats(self) -> Dict:
+        return {'requested': self.requested, 'written': self.written, 'failed': self.failed,
+                'pending': len(self._pending)}
+
+
+def check_portfolio_name(name: str) -> str:
+    if not PORTFOLIO_NAME_PATTERN.fullmatch(name or '') or '..' in name:
+        raise ValueError(f"invalid portfolio name {name!r}: use letters, digits, '.', '_' and '-'")
+    return name
+
+
+class TransactionLedger:
+    """Append-only buy/sell log with periodic snapshots of the folded holdings"""
+    
+    def __init__(self, snapshot_file: str = 'portfolio.json', ledger_file: str = 'transactions.jsonl',
+                 compact_every: int = LEDGER_COMPACT_EVERY, fsync: str = 'snapshots'):
+        self.snapshot_file = snapshot_file
+        self.ledger_file = ledger_file
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.pending = 0
+        # Notes about damage that was repaired, for the storage backend to pass on
+        self.recovered: List[str] = []
+        self._tail_checked = False
+    
+    @staticmethod
+    def make(kind: str, crypto_id: str, amount: float, price: Optional[float] = None,
+             timestamp: Optional[str] = None) -> Dict:
+        return {
+            'type': kind,
+            'id': crypto_id,
+            'amount': amount,
+            'price': price,
+            'timestamp': timestamp or datetime.now().isoformat(timespec='seconds')
+        }
+    
+    @staticmethod
+    def apply(holdings: Dict, txn: Dict):
+        crypto_id = txn['id']
+        amount = txn['amount']
+        
+        if txn['type'] == 'buy':
+            if crypto_id in holdings:
+                holding = holdings[crypto_id]
+                new_amount = holding['amount'] + amount
+                holding['avg_price'] = ((holding['avg_price'] * holding['amount']) + (txn['price'] * amount)) / new_amount
+                holding['amount'] = new_amount
+            else:
+                holdings[crypto_id] = {
+                    'amount': amount,
+                    'avg_price': txn['price'],
+                    'added': txn['timestamp'][:10]
+                }
+        elif crypto_id in holdings:
+            if amount is None or amount >= holdings[crypto_id]['amount']:
+                del holdings[crypto_id]
+            else:
+                holdings[crypto_id]['amount'] -= amount
+    
+    def load(self) -> Dict:
+        """Current holdings: the last snapshot plus every transaction appended since.
+        
+        An unreadable snapshot is set aside and rebuilt from the previous one (.bak) or, failing
+        that, by replaying the whole ledger; `recovered` then says what happened.
+        """
+        rebuilt = False
+        try:
+            holdings, offset = self._read_snapshot(self.snapshot_file)
+        except ValueError as e:
+            holdings, offset = self._recover(e)
+            rebuilt = True
+        self._repair_tail()
+        
+        self.pending = 0
+        for txn in self.transactions(offset):
+            self.apply(holdings, txn)
+            self.pending += 1
+        if rebuilt:
+            self.compact(holdings)
+        return holdings
+    
+    @staticmethod
+    def _read_snapshot(path: str) -> Tuple[Dict, int]:
+        if not os.path.exists(path):
+            return {}, 0
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if isinstance(data, dict) and 'holdings' in data and 'ledger_offset' in data:
+            holdings, offset = data['holdings'], data['ledger_offset']
+        else:
+            # Plain holdings dict written before the ledger existed
+            holdings, offset = data, 0
+        if not isinstance(holdings, dict) or not isinstance(offset, int) or offset < 0:
+            raise ValueError("not a holdings snapshot")
+        for holding in holdings.values():
+            if not isinstance(holding, dict) or not all(isinstance(holding.get(key), (int, float))
+                                                        for key in ('amount', 'avg_price')):
+                raise ValueError("malformed holding")
+        return holdings, offset
+    
+    def _recover(self, error: ValueError) -> Tuple[Dict, int]:
+        kept = set_aside(self.snapshot_file)
+        backup = self.snapshot_file + '.bak'
+        try:
+            holdings, offset = self._read_snapshot(backup) if os.path.exists(backup) else (None, 0)
+        except ValueError:
+            holdings, offset = None, 0
+        source = "the previous snapshot"
+        if holdings is None:
+            if not os.path.exists(self.ledger_file):
+                raise ValueError(f"{self.snapshot_file} is corrupt ({error}) and there is no backup or "
+                                 f"transaction history to rebuild it from; the file was kept as {kept}")
+            holdings, offset, source = {}, 0, "the transaction history"
+        self.recovered.append(f"{os.path.basename(self.snapshot_file)} was unreadable ({error}); rebuilt from {source}, "
+                              f"original kept as {os.path.basename(kept)}")
+        return holdings, offset
+    
+    def _repair_tail(self):
+        """End a torn final line so the next append starts on a line of its own.
+        
+        The partial line stays where it is (transactions() skips it), which keeps every
+        snapshot's ledger_offset pointing at the same entries.
+        """
+        self._tail_checked = True
+        if not os.path.exists(self.ledger_file):
+            return
+        with open(self.ledger_file, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+            if tail.endswith(b'\n'):
+                return
+            torn = len(tail) - 1 - tail.rfind(b'\n')
+            f.write(b'\n')
+        self.recovered.append(f"{os.path.basename(self.ledger_file)} ended in a partial entry ({torn} bytes) "
+                              f"from an interrupted write; it is skipped and new entries start after it")
+    
+    def transactions(self, offset: int = 0):
+        if not os.path.exists(self.ledger_file):
+            return
+        with open(self.ledger_file, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Partial entry from an interrupted append, closed off by _repair_tail
+                    continue
+    
+    def history(self, crypto_id: Optional[str] = None) -> List[Dict]:
+        return [txn for txn in self.transactions() if crypto_id is None or txn['id'] == crypto_id]
+    
+    def append(self, txn: Dict) -> bool:
+        """Append one transaction; returns True once a compaction is due"""
+        return self.append_many([txn])
+    
+    def append_many(self, txns: List[Dict]) -> bool:
+        """Append all of `txns` or none of them, so a failed append can simply be retried"""
+        if not self._tail_checked:
+            self._repair_tail()
+        offset = os.path.getsize(self.ledger_file) if os.path.exists(self.ledger_file) else 0
+        try:
+            with open(self.ledger_file, 'a') as f:
+                f.writelines(json.dumps(txn) + '\n' for txn in txns)
+                if self.fsync == 'always':
+                    f.flush()
+                    os.fsync(f.fileno())
+        except BaseException:
+            # The write may have stopped partway through a line, or after some of the entries
+            self._tail_checked = False
+            with contextlib.suppress(OSError):
+                os.truncate(self.ledger_file, offset)
+            raise
+        self.pending += len(txns)
+        return self.pending >= self.compact_every
+    
+    def append_stream(self, txns) -> int:
+        """Append an iterable of transactions in one pass; rolled back if it fails midway"""
+        if not self._tail_checked:
+            self._repair_tail()
+        offset = os.path.getsize(self.ledger_file) if os.path.exists(self.ledger_file) else 0
+        count = 0
+        try:
+            with open(self.ledger_file, 'a', buffering=1 << 20) as f:
+                for txn in txns:
+                    f.write(json.dumps(txn) + '\n')
+                    count += 1
+                if self.fsync == 'always':
+                    f.flush()
+                    os.fsync(f.fileno())
+        except BaseException:
+            os.truncate(self.ledger_file, offset)
+            raise
+        self.pending += count
+        return count
+    
+    def compact(self, holdings: Dict):
+        offset = os.path.getsize(self.ledger_file) if os.path.exists(self.ledger_file) else 0
+        snapshot = {'ledger_offset': offset, 'holdings': holdings}
+        atomic_write(self.snapshot_file, lambda f: json.dump(snapshot, f, indent=2), fsync=self.fsync != 'never', backup=True)
+        self.pending = 0
+
+
+class JsonStorage:
+    """Flat-file backend: a ledger and snapshot per portfolio, plus settings and price cache files"""
+    
+    def __init__(self, directory: str = '.', fsync: str = 'snapshots'):
+        self.directory = directory
+        self.fsync = fsync
+        self.settings_file = os.path.join(directory, 'settings.json')
+        self.price_cache_file = os.path.join(directory, 'price_cache.json')
+        self._ledgers: Dict[str, TransactionLedger] = {}
+        # Notes about corrupt files that were set aside and recovered, for the caller to report
+        self.recovered: List[str] = []
+    
+    def ledger(self, portfolio: str = DEFAULT_PORTFOLIO) -> TransactionLedger:
+        if portfolio not in self._ledgers:
+            check_portfolio_name(portfolio)
+            suffix = '' if portfolio == DEFAULT_PORTFOLIO else f'-{portfolio}'
+            self._ledgers[portfolio] = TransactionLedger(
+                os.path.join(self.directory, f'portfolio{suffix}.json'),
+                os.path.join(self.directory, f'transactions{suffix}.jsonl'), fsync=self.fsync)
+        return self._ledgers[portfolio]
+    
+    def list_portfolios(self) -> List[str]:
+        names = set()
+        for filename in os.listdir(self.directory):
+            for prefix, ext in (('portfolio', '.json'), ('transactions', '.jsonl')):
+                if filename == prefix + ext:
+                    names.add(DEFAULT_PORTFOLIO)
+                elif filename.startswith(prefix + '-') and filename.endswith(ext):
+                    names.add(filename[len(prefix) + 1:-len(ext)])
+        return sorted(names)
+    
+    def has_portfolio(self, portfolio: str = DEFAULT_PORTFOLIO) -> bool:
+        ledger = self.ledger(portfolio)
+        return os.path.exists(ledger.snapshot_file) or os.path.exists(ledger.ledger_file)
+    
+    def load_holdings(self, portfolio: str = DEFAULT_PORTFOLIO) -> Dict:
+        ledger = self.ledger(portfolio)
+        try:
+            return ledger.load()
+        finally:
+            self._collect(ledger)
+    
+    def _collect(self, ledger: TransactionLedger):
+        self.recovered.extend(ledger.recovered)
+        ledger.recovered.clear()
+    
+    def record(self, portfolio: str, txns: List[Dict], holdings: Dict):
+        """Append `txns`, snapshotting when due; raises only if nothing was appended"""
+        ledger = self.ledger(portfolio)
+        try:
+            due = ledger.append_many(txns)
+        finally:
+            self._collect(ledger)
+        if due:
+            # The transactions are saved by now; raising would have them appended again on retry
+            try:
+                ledger.compact(holdings)
+            except OSError as e:
+                self.recovered.append(f"Could not update {os.path.basename(ledger.snapshot_file)} ({e}); "
+                                      f"transactions are saved and the snapshot is retried after the next change")
+    
+    def save_holdings(self, portfolio: str, holdings: Dict):
+        self.ledger(portfolio).compact(holdings)
+    
+    def import_transactions(self, portfolio: str, txns, holdings: Dict) -> int:
+        """Stream `txns` into the history, then snapshot `holdings` once they are all consumed"""
+        ledger = self.ledger(portfolio)
+        try:
+            count = ledger.append_stream(txns)
+        finally:
+            self._collect(ledger)
+        ledger.compact(holdings)
+        return count
+    
+    def transactions(self, portfolio: str = DEFAULT_PORTFOLIO, crypto_id: Optional[str] = None) -> List[Dict]:
+        return self.ledger(portfolio).history(crypto_id)
+    
+    def load_settings(self) -> Dict:
+        if not os.path.exists(self.settings_file):
+            return {}
+        try:
+            with open(self.settings_file, 'r') as f:
+                return json.load(f)
+        except ValueError as e:
+            kept = set_aside(self.settings_file)
+            settings = {}
+            with contextlib.suppress(OSError, ValueError):
+                with open(self.settings_file + '.bak', 'r') as f:
+                    settings = json.load(f)
+            source = "the previous copy" if settings else "defaults"
+            self.recovered.append(f"settings.json was unreadable ({e}); using {source}, "
+                                  f"original kept as {os.path.basename(kept)}")
+            return settings
+    
+    def save_settings(self, settings: Dict):
+        atomic_write(self.settings_file, lambda f: json.dump(settings, f, indent=2),
+                     fsync=self.fsync != 'never', backup=True)
+    
+    def load_prices(self) -> List:
+        if not os.path.exists(self.price_cache_file):
+            return []
+        with open(self.price_cache_file, 'r') as f:
+            return json.load(f)
+    
+    def save_prices(self, rows: List):
+        # Only a cache: atomic so it is never torn, but not worth an fsync
+        atomic_write(self.price_cache_file, lambda f: json.dump(rows, f), fsync=False)
+
+
+class SqliteStorage:
+    """SQLite backend in WAL mode; one connection per thread so readers never block each other"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS holdings (
+            portfolio TEXT NOT NULL,
+            coin_id TEXT NOT NULL,
+            amount REAL NOT NULL,
+            avg_price REAL NOT NULL,
+            added TEXT,
+            PRIMARY KEY (portfolio, coin_id)
+        );
+        CREATE TABLE IF NOT EXISTS transactions (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            portfolio TEXT NOT NULL,
+            type TEXT NOT NULL,
+            coin_id TEXT NOT NULL,
+            amount REAL,
+            price REAL,
+            timestamp TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS transactions_by_coin ON transactions (portfolio, coin_id, timestamp);
+        CREATE TABLE IF NOT EXISTS portfolios (
+            name TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS prices (
+            coin_id TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            quote TEXT NOT NULL,
+            PRIMARY KEY (coin_id, currency)
+        );
+    """
+    
+    # Commits are atomic already; the fsync policy only decides how often SQLite syncs them
+    SYNCHRONOUS = {'always': 'FULL', 'snapshots': 'NORMAL', 'never': 'OFF'}
+    
+    def __init__(self, path: str = 'portfolio.db', fsync: str = 'snapshots'):
+        self.path = path
+        # Price history and the coin index are kept next to the database
+        self.directory = os.path.dirname(path) or '.'
+        self.fsync = fsync
+        self.recovered: List[str] = []
+        self._local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(self.SCHEMA)
+    
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={self.SYNCHRONOUS[self.fsync]}')
+            self._local.conn = conn
+        return conn
+    
+    def list_portfolios(self) -> List[str]:
+        rows = self.connection().execute('SELECT name FROM portfolios ORDER BY name')
+        return [name for (name,) in rows]
+    
+    def has_portfolio(self, portfolio: str = DEFAULT_PORTFOLIO) -> bool:
+        row = self.connection().execute('SELECT 1 FROM portfolios WHERE name = ?', (portfolio,)).fetchone()
+        return row is not None
+    
+    def load_holdings(self, portfolio: str = DEFAULT_PORTFOLIO) -> Dict:
+        rows = self.connection().execute(
+            'SELECT coin_id, amount, avg_price, added FROM holdings WHERE portfolio = ?', (portfolio,))
+        return {coin_id: {'amount': amount, 'avg_price': avg_price, 'added': added}
+                for coin_id, amount, avg_price, added in rows}
+    
+    def record(self, portfolio: str, txns: List[Dict], holdings: Dict):
+        """Insert transactions and upsert only the holdings they touched, atomically"""
+        touched = {txn['id'] for txn in txns}
+        with self.connection() as conn:
+            conn.execute('INSERT OR IGNORE INTO portfolios (name) VALUES (?)', (portfolio,))
+            conn.executemany(
+                'INSERT INTO transactions (portfolio, type, coin_id, amount, price, timestamp) VALUES (?, ?, ?, ?, ?, ?)',
+                [(portfolio, txn['type'], txn['id'], txn['amount'], txn['price'], txn['timestamp']) for txn in txns])
+            self._write_holdings(conn, portfolio, holdings, touched)
+    
+    def save_holdings(self, portfolio: str, holdings: Dict):
+        with self.connection() as conn:
+            conn.execute('INSERT OR IGNORE INTO portfolios (name) VALUES (?)', (portfolio,))
+            conn.execute('DELETE FROM holdings WHERE portfolio = ?', (portfolio,))
+            self._write_holdings(conn, portfolio, holdings, holdings.keys())
+    
+    def import_transactions(self, portfolio: str, txns, holdings: Dict) -> int:
+        """Stream `txns` into the history and rewrite `holdings` once they are consumed, atomically"""
+        with self.connection() as conn:
+            conn.execute('INSERT OR IGNORE INTO portfolios (name) VALUES (?)', (portfolio,))
+            cursor = conn.executemany(
+                'INSERT INTO transactions (portfolio, type, coin_id, amount, price, timestamp) VALUES (?, ?, ?, ?, ?, ?)',
+                ((portfolio, txn['type'], txn['id'], txn['amount'], txn['price'], txn['timestamp']) for txn in txns))
+            conn.execute('DELETE FROM holdings WHERE portfolio = ?', (portfolio,))
+            self._write_holdings(conn, portfolio, holdings, holdings.keys())
+        return cursor.rowcount
+    
+    @staticmethod
+    def _write_holdings(conn: sqlite3.Connection, portfolio: str, holdings: Dict, coin_ids):
+        upserts, deletes = [], []
+        for coin_id in coin_ids:
+            holding = holdings.get(coin_id)
+            if holding:
+                upserts.append((portfolio, coin_id, holding['amount'], holding['avg_price'], holding.get('added')))
+            else:
+                deletes.append((portfolio, coin_id))
+        conn.executemany('INSERT OR REPLACE INTO holdings VALUES (?, ?, ?, ?, ?)', upserts)
+        conn.executemany('DELETE FROM holdings WHERE portfolio = ? AND coin_id = ?', deletes)
+    
+    def transactions(self, portfolio: str = DEFAULT_PORTFOLIO, crypto_id: Optional[str] = None) -> List[Dict]:
+        query = 'SELECT type, coin_id, amount, price, timestamp FROM transactions WHERE portfolio = ?'
+        params = [portfolio]
+        if crypto_id is not None:
+            query += ' AND coin_id = ?'
+            params.append(crypto_id)
+        rows = self.connection().execute(query + ' ORDER BY seq', params)
+        return [{'type': kind, 'id': coin_id, 'amount': amount, 'price': price, 'timestamp': timestamp}
+                for kind, coin_id, amount, price, timestamp in rows]
+    
+    def load_settings(self) -> Dict:
+        rows = self.connection().execute('SELECT key, value FROM settings')
+        return {key: json.loads(value) for key, value in rows}
+    
+    def save_settings(self, settings: Dict):
+        with self.connection() as conn:
+            conn.executemany('INSERT OR REPLACE INTO settings VALUES (?, ?)',
+                             [(key, json.dumps(value)) for key, value in settings.items()])
+    
+    def load_prices(self) -> List:
+        rows = self.connection().execute('SELECT coin_id, currency, fetched_at, quote FROM prices')
+        return [[coin_id, currency, fetched_at, json.loads(quote)] for coin_id, currency, fetched_at, quote in rows]
+    
+    def save_prices(self, rows: List):
+        with self.connection() as conn:
+            conn.execute('DELETE FROM prices')
+            conn.executemany('INSERT INTO prices VALUES (?, ?, ?, ?)',
+                             [(coin_id, currency, fetched_at, json.dumps(quote))
+                              for coin_id, currency, fetched_at, quote in rows])
+    
+    def migrate_from(self, source) -> Dict:
+        """Copy every portfolio, its history, settings and cached prices from another backend"""
+        counts = {'portfolios': 0, 'transactions': 0}
+        for portfolio in source.list_portfolios():
+            txns = source.transactions(portfolio)
+            with self.connection() as conn:
+                conn.execute('DELETE FROM transactions WHERE portfolio = ?', (portfolio,))
+            self.record(portfolio, txns, {})
+            self.save_holdings(portfolio, source.load_holdings(portfolio))
+            counts['portfolios'] += 1
+            counts['transactions'] += len(txns)
+        self.save_settings(source.load_settings())
+        self.save_prices(source.load_prices())
+        return counts
+
+
+class PriceHistoryStore:
+    """Per-coin time series kept as two float64 column files (timestamps, prices), read via memmap"""
+    
+    def __init__(self, directory: str = HISTORY_DIR):
+        self.directory = directory
+        self._lock = threading.RLock()
+        # Observations recorded but not yet appended: (currency, timestamp, {coin: price})
+        self._pending: List[Tuple[str, float, Dict[str, float]]] = []
+    
+    def _paths(self, crypto_id: str, currency: str) -> Tuple[str, str]:
+        stem = os.path.join(self.directory, f"{crypto_id.replace(os.sep, '_')}.{currency}")
+        return stem + '.ts.f64', stem + '.price.f64'
+    
+    def record(self, currency: str, prices: Dict[str, float], timestamp: Optional[float] = None):
+        """Queue one observation per coin (timestamps are unix seconds); flush() appends them.
+        
+        Keeps file I/O off the fetch path: two appends per coin and currency add up to seconds
+        on a large portfolio. `prices` is kept as-is, so callers must not mutate it afterwards.
+        """
+        with self._lock:
+            self._pending.append((currency, timestamp or time.time(), prices))
+    
+    def flush(self):
+        """Append every queued observation, one write per column file however many rounds were queued"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            points: Dict[Tuple[str, str], List[Tuple[float, float]]] = {}
+            for currency, stamp, prices in pending:
+                for crypto_id, price in prices.items():
+                    points.setdefault((crypto_id, currency), []).append((stamp, price))
+            os.makedirs(self.directory, exist_ok=True)
+            for (crypto_id, currency), rows in points.items():
+                columns = np.array(rows, dtype=np.float64)
+                for path, column in zip(self._paths(crypto_id, currency), columns.T):
+                    with open(path, 'ab') as f:
+                        f.write(column.tobytes())
+    
+    def merge(self, crypto_id: str, currency: str, timestamps, prices):
+        """Fold a batch of (possibly older) points into the series, keeping it sorted and unique"""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            old_ts, old_prices = self._load(crypto_id, currency)
+            ts = np.concatenate([np.asarray(timestamps, dtype=np.float64), old_ts])
+            values = np.concatenate([np.asarray(prices, dtype=np.float64), old_prices])
+            # Existing points win over backfilled ones at the same timestamp
+            order = np.argsort(ts[::-1], kind='stable')
+            ts, values = ts[::-1][order], values[::-1][order]
+            keep = np.concatenate([ts[1:] != ts[:-1], [True]]) if len(ts) else np.zeros(0, dtype=bool)
+            # Write aside and rename so readers holding a mapping keep the old file intact
+            for path, column in zip(self._paths(crypto_id, currency), (ts[keep], values[keep])):
+                column.tofile(path + '.tmp')
+                os.replace(path + '.tmp', path)
+    
+    def _load(self, crypto_id: str, currency: str) -> Tuple[np.ndarray, np.ndarray]:
+        self.flush()
+        ts_path, price_path = self._paths(crypto_id, currency)
+        if not os.path.exists(ts_path) or not os.path.exists(price_path):
+            return np.zeros(0), np.zeros(0)
+        # Tolerate a torn append where only one column got written
+        n = min(os.path.getsize(ts_path), os.path.getsize(price_path)) // 8
+        if n == 0:
+            return np.zeros(0), np.zeros(0)
+        ts = np.memmap(ts_path, dtype=np.float64, mode='r', shape=(n,))
+        values = np.memmap(price_path, dtype=np.float64, mode='r', shape=(n,))
+        return ts, values
+    
+    def series(self, crypto_id: str, currency: str, start: Optional[float] = None,
+               end: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Points with start <= timestamp <= end, as zero-copy views over the mapped files"""
+        ts, values = self._load(crypto_id, currency)
+        lo = np.searchsorted(ts, start, side='left') if start is not None else 0
+        hi = np.searchsorted(ts, end, side='right') if end is not None else len(ts)
+        return ts[lo:hi], values[lo:hi]
+    
+    def daily_closes(self, crypto_id: str, currency: str, day_ends: np.ndarray,
+                     max_age: Optional[float] = None) -> np.ndarray:
+        """Last price at or before each timestamp in `day_ends`; NaN where none (or none within max_age)"""
+        ts, values = self._load(crypto_id, currency)
+        closes = np.full(len(day_ends), np.nan)
+        if len(ts):
+            idx = np.searchsorted(ts, day_ends, side='right') - 1
+            found = idx >= 0
+            if max_age is not None:
+                found &= ts[np.maximum(idx, 0)] > day_ends - max_age
+            closes[found] = values[idx[found]]
+        return closes
+    
+    def latest(self, crypto_id: str, currency: str) -> Optional[Tuple[float, float]]:
+        ts, values = self._load(crypto_id, currency)
+        if not len(ts):
+            return None
+        return float(ts[-1]), float(values[-1])
+
+
+class PerformanceReport:
+    """Daily portfolio value rebuilt from the transaction history and the local price history.
+    
+    The daily series is cached per portfolio and currency next to the history files. A later
+    call only values the days added since, unless a transaction landed inside the cached range.
+    Days are local calendar days; each is valued at the last recorded price on or before its end.
+    """
+    
+    def __init__(self, history: PriceHistoryStore):
+        self.history = history
+        self._cache: Dict[Tuple[str, str], Dict] = {}
+        self.days_computed = 0
+    
+    def _cache_file(self, portfolio: str, currency: str) -> str:
+        return os.path.join(self.history.directory, f"performance.{portfolio}.{currency}.npz")
+    
+    @staticmethod
+    def _day(timestamp: str) -> int:
+        return datetime.fromisoformat(timestamp[:10]).toordinal()
+    
+    @staticmethod
+    def _day_ends(first: int, last: int) -> np.ndarray:
+        return np.array([datetime.fromordinal(day + 1).timestamp() for day in range(first, last + 1)])
+    
+    def invalidate(self, portfolio: Optional[str] = None):
+        """Drop cached series, e.g. after older prices were backfilled"""
+        for key in [key for key in self._cache if portfolio is None or key[0] == portfolio]:
+            del self._cache[key]
+        prefix = f"performance.{portfolio}." if portfolio else "performance."
+        if os.path.isdir(self.history.directory):
+            for filename in os.listdir(self.history.directory):
+                if filename.startswith(prefix) and filename.endswith('.npz'):
+                    os.remove(os.path.join(self.history.directory, filename))
+    
+    def _load(self, portfolio: str, currency: str) -> Optional[Dict]:
+        if (portfolio, currency) in self._cache:
+            return self._cache[(portfolio, currency)]
+        try:
+            with np.load(self._cache_file(portfolio, currency)) as data:
+                cache = json.loads(str(data['meta']))
+                cache.update(values=data['values'], flows=data['flows'], missing=data['missing'],
+                             amounts=data['amounts'])
+        except (OSError, ValueError, KeyError):
+            return None
+        self._cache[(portfolio, currency)] = cache
+        return cache
+    
+    def _save(self, portfolio: str, currency: str, cache: Dict):
+        self._cache[(portfolio, currency)] = cache
+        meta = {key: cache[key] for key in ('first_day', 'last_day', 'ids', 'count', 'last_txn')}
+        os.makedirs(self.history.directory, exist_ok=True)
+        path = self._cache_file(portfolio, currency)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), values=cache['values'], flows=cache['flows'],
+                     missing=cache['missing'], amounts=cache['amounts'])
+        os.replace(path + '.tmp', path)
+    
+    def _extend(self, cache: Optional[Dict], txns: List[Dict], currency: str, through: int) -> Dict:
+        """Value the days after the cached range up to `through`, carrying holdings forward"""
+        if cache is None:
+            first = self._day(txns[0]['timestamp'])
+            cache = {'first_day': first, 'last_day': first - 1, 'ids': [], 'count': 0, 'last_txn': None,
+                     'values': np.zeros(0), 'flows': np.zeros(0), 'missing': np.zeros(0, dtype=np.int64),
+                     'amounts': np.zeros(0)}
+        start = cache['last_day'] + 1
+        pending = [txn for txn in txns[cache['count']:] if self._day(txn['timestamp']) <= through]
+        if through < start:
+            return cache
+        
+        ids = list(cache['ids'])
+        column = {crypto_id: i for i, crypto_id in enumerate(ids)}
+        for txn in pending:
+            if txn['id'] not in column:
+                column[txn['id']] = len(ids)
+                ids.append(txn['id'])
+        n_days = through - start + 1
+        held = np.zeros(len(ids))
+        held[:len(cache['amounts'])] = cache['amounts']
+        
+        # Fold the new transactions in order (sells are capped at what is held), as per-day deltas
+        deltas = np.zeros((len(ids), n_days))
+        cash: List[Tuple[int, int, float, Optional[float]]] = []
+        running = held.copy()
+        for txn in pending:
+            coin, day = column[txn['id']], self._day(txn['timestamp']) - start
+            if txn['type'] == 'buy':
+                amount = txn['amount']
+            else:
+                amount = -running[coin] if txn['amount'] is None else -min(txn['amount'], running[coin])
+            running[coin] += amount
+            deltas[coin, day] += amount
+            cash.append((coin, day, amount, txn['price']))
+        amounts = held[:, None] + np.cumsum(deltas, axis=1)
+        
+        # Daily close per coin: the last recorded price at or before the end of each day
+        day_ends = self._day_ends(start, through)
+        prices = np.full((len(ids), n_days), np.nan)
+        for coin, crypto_id in enumerate(ids):
+            prices[coin] = self.history.daily_closes(crypto_id, currency, day_ends)
+        
+        flows = np.zeros(n_days)
+        for coin, day, amount, price in cash:
+            # Sales recorded without a price are valued at that day's close
+            flows[day] += amount * (price if price is not None else np.nan_to_num(prices[coin, day]))
+        
+        invested = amounts > 1e-12
+        values = np.where(invested, amounts * np.nan_to_num(prices), 0.0).sum(axis=0)
+        missing = (invested & np.isnan(prices)).sum(axis=0)
+        
+        return {
+            'first_day': cache['first_day'],
+            'last_day': through,
+            'ids': ids,
+            'count': cache['count'] + len(pending),
+            'last_txn': pending[-1] if pending else cache['last_txn'],
+            'values': np.concatenate([cache['values'], values]),
+            'flows': np.concatenate([cache['flows'], flows]),
+            'missing': np.concatenate([cache['missing'], missing]),
+            'amounts': amounts[:, -1].copy()
+        }
+    
+    def daily(self, portfolio: str, currency: str, txns: List[Dict], through: Optional[int] = None) -> Optional[Dict]:
+        """The cached daily series extended to `through` (default today); only closed days are persisted"""
+        if not txns:
+            return None
+        today = datetime.now().date().toordinal()
+        through = today if through is None else min(through, today)
+        txns = sorted(txns, key=lambda txn: txn['timestamp'])
+        
+        cache = self._load(portfolio, currency)
+        if cache is not None:
+            count = cache['count']
+            # Reuse only if the cached prefix is unchanged and nothing new predates the cached days
+            if (count > len(txns) or (count and txns[count - 1] != cache['last_txn'])
+                    or any(self._day(txn['timestamp']) <= cache['last_day'] for txn in txns[count:])):
+                cache = None
+        
+        before = cache['last_day'] if cache else self._day(txns[0]['timestamp']) - 1
+        closed = min(through, today - 1)
+        if cache is None or closed > cache['last_day']:
+            cache = self._extend(cache, txns, currency, closed)
+            if cache['last_day'] >= cache['first_day']:
+                self._save(portfolio, currency, cache)
+        if through > cache['last_day']:
+            # Today keeps moving; value it fresh each time without caching
+            cache = self._extend(cache, txns, currency, through)
+        self.days_computed = max(0, cache['last_day'] - before)
+        return cache
+    
+    @staticmethod
+    def returns(values: np.ndarray, flows: np.ndarray, opening: float) -> np.ndarray:
+        """Daily time-weighted returns, treating each day's net flow as arriving at its start"""
+        base = np.concatenate([[opening], values[:-1]]) + flows
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(base > 0, values / base - 1, 0.0)
+    
+    @staticmethod
+    def irr(days: np.ndarray, cash_flows: np.ndarray, iterations: int = 200) -> Optional[float]:
+        """Annual money-weighted return: the rate at which the investor's flows net to zero"""
+        years = (days - days[0]) / 365.0
+        npv = lambda rate: float(np.dot(cash_flows, (1 + rate) ** -years))
+        lo, hi = -0.9999, 1.0
+        while npv(hi) > 0 and hi < 1e6:
+            hi *= 10
+        if npv(lo) * npv(hi) > 0:
+            return None
+        for _ in range(iterations):
+            mid = (lo + hi) / 2
+            if (npv(mid) > 0) == (npv(lo) > 0):
+                lo = mid
+            else:
+                hi = mid
+        return (lo + hi) / 2
+    
+    def report(self, portfolio: str, currency: str, txns: List[Dict], start: Optional[str] = None,
+               end: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+        """Per-day rows plus TWR, MWR, volatility and max drawdown over [start, end]"""
+        end_day = self._day(end) if end else datetime.now().date().toordinal()
+        series = self.daily(portfolio, currency, txns, end_day)
+        if series is None:
+            return [], {'currency': currency, 'days': 0}
+        
+        first = series['first_day']
+        lo = max(0, self._day(start) - first) if start else 0
+        hi = end_day - first + 1
+        values, flows, missing = series['values'][lo:hi], series['flows'][lo:hi], series['missing'][lo:hi]
+        if not len(values):
+            return [], {'currency': currency, 'days': 0}
+        opening = float(series['values'][lo - 1]) if lo > 0 else 0.0
+        
+        returns = self.returns(values, flows, opening)
+        wealth = np.cumprod(1 + returns)
+        drawdowns = wealth / np.maximum.accumulate(wealth) - 1
+        trough = int(np.argmin(drawdowns))
+        peak = int(np.argmax(wealth[:trough + 1]))
+        invested = (np.concatenate([[opening], values[:-1]]) + flows) > 0
+        
+        # Investor's view for MWR: opening value and purchases go in, sales and the closing value come out
+        day_numbers = np.arange(len(values), dtype=np.float64)
+        cash_flows = -flows.copy()
+        cash_flows[0] -= opening
+        cash_flows[-1] += values[-1]
+        
+        days = [datetime.fromordinal(first + lo + i).date().isoformat() for i in range(len(values))]
+        twr = float(wealth[-1] - 1)
+        summary = {
+            'currency': currency,
+            'start': days[0],
+            'end': days[-1],
+            'days': len(days),
+            'start_value': opening,
+            'end_value': float(values[-1]),
+            'net_flows': float(flows.sum()),
+            'twr': twr,
+            'twr_annualized': (1 + twr) ** (365 / len(days)) - 1 if len(days) >= 365 else None,
+            'mwr': self.irr(day_numbers, cash_flows),
+            'volatility': float(returns[invested].std(ddof=1) * np.sqrt(365)) if invested.sum() > 1 else None,
+            'max_drawdown': float(drawdowns[trough]),
+            'drawdown_peak': days[peak],
+            'drawdown_trough': days[trough],
+            'days_missing_prices': int((missing > 0).sum())
+        }
+        rows = [{'date': day, 'value': value, 'net_flow': flow, 'return': ret, 'drawdown': dd, 'missing_prices': gap}
+                for day, value, flow, ret, dd, gap in zip(days, values.tolist(), flows.tolist(), returns.tolist(),
+                                                           drawdowns.tolist(), missing.tolist())]
+        return rows, summary
+
+
+class GoalProjection:
+    """Monte Carlo projection of portfolio value from correlated per-coin returns.
+    
+    Each coin follows a geometric Brownian motion fitted to its daily log returns in the
+    local price history (drift, volatility and cross-coin correlation via Cholesky).
+    Amounts stay fixed, so summing a week of log returns is exact and paths advance in
+    weekly steps; paths run in chunks to bound memory and can be split across processes.
+    """
+    
+    def __init__(self, history: PriceHistoryStore, lookback_days: int = PROJECTION_LOOKBACK,
+                 min_days: int = PROJECTION_MIN_DAYS):
+        self.history = history
+        self.lookback_days = lookback_days
+        self.min_days = min_days
+    
+    def fit(self, crypto_ids: List[str], currency: str) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """(ids with enough history, mean daily log returns, their covariance)"""
+        today = datetime.now().date().toordinal()
+        day_ends = np.array([datetime.fromordinal(day + 1).timestamp()
+                             for day in range(today - self.lookback_days - 1, today)])
+        fitted, returns = [], []
+        for crypto_id in crypto_ids:
+            # A day with no observation of its own is a gap, not a flat day
+            closes = self.history.daily_closes(crypto_id, currency, day_ends, max_age=86400)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                daily = np.diff(np.log(closes))
+            if np.isfinite(daily).sum() >= self.min_days:
+                fitted.append(crypto_id)
+                returns.append(daily)
+        if not fitted:
+            return [], np.zeros(0), np.zeros((0, 0))
+        
+        returns = np.ma.masked_invalid(np.array(returns))
+        drift = returns.mean(axis=1).filled(0.0)
+        cov = np.atleast_2d(np.ma.cov(returns, allow_masked=True).filled(0.0))
+        return fitted, drift, cov
+    
+    @staticmethod
+    def cholesky(cov: np.ndarray) -> np.ndarray:
+        """Cholesky factor, nudging a pairwise-estimated covariance to positive definite if needed"""
+        try:
+            return np.linalg.cholesky(cov)
+        except np.linalg.LinAlgError:
+            eigenvalues, vectors = np.linalg.eigh(cov)
+            fixed = (vectors * np.maximum(eigenvalues, 1e-12)) @ vectors.T
+            return np.linalg.cholesky(fixed)
+    
+    @staticmethod
+    def simulate(values: np.ndarray, fixed: float, drift: np.ndarray, chol: np.ndarray, target: float,
+                 step_days: List[float], paths: int, seed, chunk: int = PROJECTION_CHUNK) -> Tuple[np.ndarray, int]:
+        """Terminal portfolio values and how many paths touched `target` at any step"""
+        rng = np.random.default_rng(seed)
+        terminal = np.empty(paths)
+        hits = 0
+        # Pre-scale the factor and drift per distinct step length (only the last step differs)
+        scaled = {days: (chol.T * np.sqrt(days), drift * days) for days in set(step_days)}
+        for lo in range(0, paths, chunk):
+            n = min(chunk, paths - lo)
+            log_growth = np.zeros((n, len(values)))
+            hit = np.full(n, values.sum() + fixed >= target)
+            for days in step_days:
+                factor, mean = scaled[days]
+                # Antithetic pairs: half the draws, and a lower-variance estimate
+                shocks = rng.standard_normal(((n + 1) // 2, len(values)))
+                log_growth += np.concatenate([shocks, -shocks])[:n] @ factor
+                log_growth += mean
+                total = np.exp(log_growth) @ values + fixed
+                hit |= total >= target
+            terminal[lo:lo + n] = total if step_days else values.sum() + fixed
+            hits += int(hit.sum())
+        return terminal, hits
+    
+    def project(self, holdings_value: Dict[str, float], currency: str, target: float, horizon_days: int,
+                paths: int = PROJECTION_PATHS, workers: int = 1, seed: Optional[int] = None) -> Dict:
+        start = time.perf_counter()
+        fitted, drift, cov = self.fit([crypto_id for crypto_id, value in holdings_value.items() if value > 0],
+                                      currency)
+        values = np.array([holdings_value[crypto_id] for crypto_id in fitted], dtype=np.float64)
+        # Coins without enough history are carried at today's value
+        fixed = float(sum(holdings_value.values()) - values.sum())
+        chol = self.cholesky(cov) if fitted else np.zeros((0, 0))
+        
+        horizon_days = max(0, horizon_days)
+        step_days = [float(PROJECTION_STEP_DAYS)] * (horizon_days // PROJECTION_STEP_DAYS)
+        if horizon_days % PROJECTION_STEP_DAYS:
+            step_days.append(float(horizon_days % PROJECTION_STEP_DAYS))
+        
+        workers = max(1, min(workers, paths))
+        seeds = np.random.SeedSequence(seed).spawn(workers)
+        shares = [paths // workers + (1 if i < paths % workers else 0) for i in range(workers)]
+        args = (values, fixed, drift, chol, target, step_days)
+        if workers == 1:
+            results = [self.simulate(*args, shares[0], seeds[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(self.simulate, *zip(*[args] * workers), shares, seeds))
+        terminal = np.concatenate([result[0] for result in results])
+        hits = sum(result[1] for result in results)
+        
+        weights = values / values.sum() if fitted else values
+        portfolio_var = float(weights @ cov @ weights) if fitted else 0.0
+        percentiles = np.percentile(terminal, [5, 25, 50, 75, 95]) if len(terminal) else np.zeros(5)
+        return {
+            'current_value': float(sum(holdings_value.values())),
+            'target_value': target,
+            'horizon_days': horizon_days,
+            'paths': paths,
+            'probability_by_date': hits / paths if paths else 0.0,
+            'probability_at_date': float((terminal >= target).mean()) if paths else 0.0,
+            'expected_value': float(terminal.mean()) if paths else 0.0,
+            'percentiles': dict(zip(('p5', 'p25', 'p50', 'p75', 'p95'), percentiles.tolist())),
+            'drift_annual': float(np.exp(weights @ drift * 365) - 1) if fitted else 0.0,
+            'volatility_annual': float(np.sqrt(portfolio_var * 365)),
+            'modelled': fitted,
+            'no_history': [crypto_id for crypto_id in holdings_value if crypto_id not in fitted],
+            'seconds': round(time.perf_counter() - start, 3)
+        }
+
+
+class CoinIndex:
+    """Offline id/symbol/name search over /coins/list: sorted keys for prefixes, trigrams for fuzzy"""
+    
+    def __init__(self, index_file: Optional[str] = COIN_INDEX_FILE, max_age: float = COIN_INDEX_MAX_AGE):
+        self.index_file = index_file
+        self.max_age = max_age
+        self.fetched_at = 0.0
+        self.coins: List[Tuple[str, str, str]] = []
+        self._keys: List[Tuple[str, int]] = []
+        self._by_id: Dict[str, int] = {}
+        self._by_symbol: Dict[str, List[int]] = {}
+        self._trigrams: Dict[str, set] = {}
+        self._refreshing = threading.Lock()
+        self.load()
+    
+    @property
+    def ready(self) -> bool:
+        return bool(self.coins)
+    
+    @property
+    def stale(self) -> bool:
+        return time.time() - self.fetched_at > self.max_age
+    
+    @staticmethod
+    def _grams(text: str) -> set:
+        padded = f"  {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    
+    def build(self, coins: List[Tuple[str, str, str]], fetched_at: Optional[float] = None):
+        keys, by_id, by_symbol, trigrams = [], {}, {}, {}
+        for idx, (crypto_id, symbol, name) in enumerate(coins):
+            by_id[crypto_id] = idx
+            by_symbol.setdefault(symbol.lower(), []).append(idx)
+            for field in {crypto_id, symbol.lower(), name.lower()}:
+                keys.append((field, idx))
+                for gram in self._grams(field):
+                    trigrams.setdefault(gram, set()).add(idx)
+        keys.sort()
+        
+        # Swap in the finished index in one step so readers never see a partial build
+        self.coins, self._keys, self._by_id, self._by_symbol, self._trigrams = coins, keys, by_id, by_symbol, trigrams
+        self.fetched_at = fetched_at or time.time()
+    
+    def load(self):
+        if not self.index_file or not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r') as f:
+                data = json.load(f)
+            self.build([tuple(coin) for coin in data['coins']], data['fetched_at'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    
+    def save(self):
+        if not self.index_file:
+            return
+        index = {'fetched_at': self.fetched_at, 'coins': self.coins}
+        # A cache that can be downloaded again, so no fsync; but never left half-written
+        atomic_write(self.index_file, lambda f: json.dump(index, f), fsync=False)
+    
+    def refresh(self, fetch) -> bool:
+        """Rebuild from fetch() -> /coins/list payload; skipped if another refresh is running"""
+        if not self._refreshing.acquire(blocking=False):
+            return False
+        try:
+            coins = [(coin['id'], coin['symbol'], coin['name']) for coin in fetch()]
+            if coins:
+                self.build(coins)
+                self.save()
+            return bool(coins)
+        except Exception:
+            return False
+        finally:
+            self._refreshing.release()
+    
+    def ensure(self, fetch) -> bool:
+        """Block until the index is usable, fetching it unless a running refresh already did"""
+        if not self.ready:
+            with self._refreshing:
+                pass
+            if not self.ready:
+                self.refresh(fetch)
+        return self.ready
+    
+    def refresh_in_background(self, fetch):
+        threading.Thread(target=self.refresh, args=(fetch,), daemon=True).start()
+    
+    def _coin(self, idx: int) -> Dict:
+        crypto_id, symbol, name = self.coins[idx]
+        return {'id': crypto_id, 'symbol': symbol, 'name': name}
+    
+    @staticmethod
+    def _preference(crypto_id: str) -> Tuple:
+        # Without market caps, plain short ids ("bitcoin") beat bridged/wrapped variants
+        return ('-' in crypto_id, len(crypto_id), crypto_id)
+    
+    def resolve(self, text: str, prefer: Optional[List[str]] = None) -> Optional[str]:
+        """Map an id or ticker symbol to a coin id"""
+        text = text.strip().lower()
+        if text in self._by_id:
+            return text
+        candidates = [self.coins[idx][0] for idx in self._by_symbol.get(text, [])]
+        if not candidates:
+            return None
+        preferred = [crypto_id for crypto_id in candidates if prefer and crypto_id in prefer]
+        return min(preferred or candidates, key=self._preference)
+    
+    def search(self, query: str, limit: int = 5) -> List[Dict]:
+        query = query.strip().lower()
+        if not query:
+            return []
+        
+        ranked: List[int] = []
+        seen = set()
+        
+        def take(indices):
+            for idx in sorted(indices, key=lambda i: self._preference(self.coins[i][0])):
+                if idx not in seen:
+                    seen.add(idx)
+                    ranked.append(idx)
+        
+        # Exact id/symbol, then prefix matches, then fuzzy trigram overlap
+        take([self._by_id[query]] if query in self._by_id else [])
+        take(self._by_symbol.get(query, []))
+        if len(ranked) < limit:
+            lo = bisect.bisect_left(self._keys, (query,))
+            hi = bisect.bisect_left(self._keys, (query + '\uffff',))
+            take({idx for _, idx in self._keys[lo:hi]})
+        if len(ranked) < limit:
+            grams = self._grams(query)
+            scores: Dict[int, int] = {}
+            for gram in grams:
+                for idx in self._trigrams.get(gram, ()):
+                    scores[idx] = scores.get(idx, 0) + 1
+            threshold = max(1, len(grams) // 2)
+            fuzzy = sorted((idx for idx, score in scores.items() if score >= threshold),
+                           key=lambda idx: (-scores[idx], self._preference(self.coins[idx][0])))
+            for idx in fuzzy[:limit]:
+                if idx not in seen:
+                    seen.add(idx)
+                    ranked.append(idx)
+        
+        return [self._coin(idx) for idx in ranked[:limit]]
+
+
+class AlertEngine:
+    """Price and portfolio-value alerts, indexed per (coin, currency) in sorted threshold lists.
+    
+    A tick only bisects the two lists for its key and pops the crossed prefix/suffix,
+    so checking costs O(log n) plus the alerts that actually fire. Rules are one-shot.
+    """
+    
+    KINDS = ('above', 'below', 'move')
+    
+    def __init__(self, rules: Optional[List[Dict]] = None, sinks: Optional[List[str]] = None, post=None):
+        self.rules: Dict[str, Dict] = {}
+        self.sinks = sinks or ['stdout']
+        self.out = None
+        self.post = post or requests.post
+        self._above: Dict[Tuple[str, str], List[Tuple[float, str]]] = {}
+        self._below: Dict[Tuple[str, str], List[Tuple[float, str]]] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        for rule in rules or []:
+            self._index(dict(rule))
+    
+    @staticmethod
+    def _entries(rule: Dict) -> List[Tuple[str, Tuple[float, str]]]:
+        """The rule's (list, entry) pairs: which threshold list it sits in, and at what level"""
+        if rule['kind'] == 'move':
+            reference, pct = rule['reference'], rule['threshold'] / 100
+            return [('above', (reference * (1 + pct), rule['id'])), ('below', (reference * (1 - pct), rule['id']))]
+        return [(rule['kind'], (rule['threshold'], rule['id']))]
+    
+    def _index(self, rule: Dict):
+        key = (rule['coin'], rule['currency'])
+        for side, entry in self._entries(rule):
+            index = self._above if side == 'above' else self._below
+            bisect.insort(index.setdefault(key, []), entry)
+        self.rules[rule['id']] = rule
+        if rule['id'].isdigit():
+            self._next_id = max(self._next_id, int(rule['id']) + 1)
+    
+    def add(self, kind: str, coin: str, threshold: float, currency: str,
+            reference: Optional[float] = None, rule_id: Optional[str] = None) -> Dict:
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown alert kind: {kind}")
+        if kind == 'move' and not reference:
+            raise ValueError("Percent-move alerts need a reference price")
+        with self._lock:
+            rule = {
+                'id': rule_id or str(self._next_id),
+                'kind': kind,
+                'coin': coin,
+                'currency': currency,
+                'threshold': threshold,
+                'reference': reference,
+                'created': datetime.now().isoformat(timespec='seconds')
+            }
+            self._index(rule)
+        return rule
+    
+    def remove(self, rule_id: str) -> bool:
+        with self._lock:
+            rule = self.rules.pop(rule_id, None)
+            if rule is None:
+                return False
+            self._unindex(rule)
+            return True
+    
+    def _unindex(self, rule: Dict):
+        # Stale entries would keep needs_portfolio() true, valuing the portfolio on every tick
+        key = (rule['coin'], rule['currency'])
+        for side, entry in self._entries(rule):
+            index = self._above if side == 'above' else self._below
+            entries = index.get(key, [])
+            i = bisect.bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+            if not entries:
+                index.pop(key, None)
+    
+    def watched(self) -> Dict[str, List[str]]:
+        """Coins with live rules, grouped by currency"""
+        coins: Dict[str, List[str]] = {}
+        for rule in self.rules.values():
+            if rule['coin'] != PORTFOLIO_KEY:
+                coins.setdefault(rule['currency'], []).append(rule['coin'])
+        return {currency: list(dict.fromkeys(ids)) for currency, ids in coins.items()}
+    
+    def needs_portfolio(self, currency: str) -> bool:
+        return (PORTFOLIO_KEY, currency) in self._above or (PORTFOLIO_KEY, currency) in self._below
+    
+    def check(self, coin: str, currency: str, value: float) -> List[Dict]:
+        key = (coin, currency)
+        crossed = []
+        with self._lock:
+            above = self._above.get(key)
+            if above:
+                cut = bisect.bisect_right(above, (value, '\uffff'))
+                crossed.extend(above[:cut])
+                del above[:cut]
+            below = self._below.get(key)
+            if below:
+                cut = bisect.bisect_left(below, (value, ''))
+                crossed.extend(below[cut:])
+                del below[cut:]
+            
+            fired = []
+            for threshold, rule_id in crossed:
+                rule = self.rules.pop(rule_id, None)
+                if rule is None:
+                    continue
+                # The crossed entry is gone already; this drops a move rule's other side and empty lists
+                self._unindex(rule)
+                direction = 'above' if value >= threshold else 'below'
+                fired.append(dict(rule, value=value, crossed=threshold, direction=direction,
+                                  triggered=datetime.now().isoformat(timespec='seconds')))
+        return fired
+    
+    def deliver(self, alerts: List[Dict]):
+        for alert in alerts:
+            name = 'Portfolio value' if alert['coin'] == PORTFOLIO_KEY else alert['coin'].upper()
+            alert['message'] = (f"{name} is {alert['direction']} {alert['crossed']:,.2f} "
+                                f"{alert['currency'].upper()} (now {alert['value']:,.2f})")
+            line = json.dumps(alert)
+            for sink in self.sinks:
+                try:
+                    if sink == 'stdout':
+                        out = self.out or sys.stdout
+                        out.write(line + '\n')
+                        out.flush()
+                    elif sink.startswith(('http://', 'https://')):
+                        self.post(sink, json=alert, timeout=HTTP_TIMEOUT)
+                    else:
+                        with open(sink[len('file:'):] if sink.startswith('file:') else sink, 'a') as f:
+                            f.write(line + '\n')
+                except (OSError, requests.RequestException) as e:
+                    UI.error(f"Alert delivery to {sink} failed: {str(e)}")
+    
+    def to_list(self) -> List[Dict]:
+        return [rule for rule in self.rules.values() if rule['id'] != 'goal']
 
-class UI:
+
+class TradeImporter:
+    """Streams exchange trade exports (CSV, JSON Lines or a JSON array) into ledger transactions.
     
-    @staticmethod
-    def clear():
-        os.system('cls' if os.name == 'nt' else 'clear')
+    Each stage is a generator, so a file is read, normalized, resolved and folded into
+    holdings one row at a time; memory stays flat however long the export is.
+    """
     
-    @staticmethod
-    def line(char='─', length=60):
-        return char * length
+    # Column aliases seen in Binance, Coinbase, Kraken and generic exports, most specific first
+    COLUMNS = (
+        ('timestamp', ('timestamp', 'date(utc)', 'date', 'time', 'datetime', 'created_at', 'created at')),
+        ('side', ('side', 'transaction type', 'trade type', 'type')),
+        ('symbol', ('symbol', 'asset', 'coin', 'base asset', 'base', 'pair', 'market', 'id')),
+        ('amount', ('executed', 'quantity transacted', 'quantity', 'qty', 'vol', 'size', 'filled', 'amount')),
+        ('price', ('price', 'spot price at transaction', 'price at transaction', 'rate')),
+        ('total', ('amount', 'total', 'subtotal', 'cost')),
+        ('quote', ('quote', 'quote asset', 'spot price currency', 'price currency')),
+    )
     
-    @staticmethod
-    def header(text: str):
-        print()
-        print(f"{Colors.BOLD}{Colors.WHITE}{text.center(60)}{Colors.RESET}")
-        print(f"{Colors.GRAY}{UI.line()}{Colors.RESET}")
-        print()
+    # Quote currencies stripped from pairs like BTCUSDT; stablecoins count as usd
+    QUOTES = {'usdt': 'usd', 'usdc': 'usd', 'busd': 'usd', 'dai': 'usd', 'usd': 'usd',
+              'eur': 'eur', 'gbp': 'gbp', 'inr': 'inr'}
     
-    @staticmethod
-    def section(text: str):
-        print(f"\n{Colors.BOLD}{Colors.WHITE}{text}{Colors.RESET}")
-        print(f"{Colors.GRAY}{UI.line('─', len(text))}{Colors.RESET}")
+    NUMBER = re.compile(r'-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?')
     
-    @staticmethod
-    def info(label: str, value: str, color=Colors.WHITE):
-        print(f"{Colors.GRAY}{label:<20}{Colors.RESET}{color}{value}{Colors.RESET}")
+    def __init__(self, resolve, currency: str = 'usd'):
+        self.resolve = resolve
+        self.currency = currency
+        self.report = {'rows': 0, 'imported': 0, 'skipped': 0, 'other_currency': 0, 'unknown_symbols': {}}
+        self.imported_at = datetime.now().isoformat(timespec='seconds')
+        self._ids: Dict[str, Optional[str]] = {}
+        self._symbols: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._suffixes = sorted(self.QUOTES, key=len, reverse=True)
     
-    @staticmethod
-    def success(message: str):
-        print(f"{Colors.GREEN}✓{Colors.RESET} {message}")
+    @classmethod
+    def columns(cls, names) -> Dict[str, str]:
+        """Map normalized field names to the export's own column names"""
+        available = {str(name).strip().lower(): name for name in names}
+        mapping = {}
+        for field, aliases in cls.COLUMNS:
+            for alias in aliases:
+                if alias in available and available[alias] not in mapping.values():
+                    mapping[field] = available[alias]
+                    break
+        return mapping
     
     @staticmethod
-    def error(message: str):
-        print(f"{Colors.RED}✗{Colors.RESET} {message}")
+    def detect(path: str) -> str:
+        if path.endswith('.jsonl') or path.endswith('.ndjson'):
+            return 'jsonl'
+        if path.endswith('.json'):
+            return 'json'
+        return 'csv'
     
-    @staticmethod
-    def prompt(message: str) -> str:
-        return input(f"{Colors.CYAN}› {Colors.RESET}{message} ")
+    def rows(self, path: str, kind: Optional[str] = None, reverse: bool = False):
+        """Raw rows as dicts; `reverse` reads CSV/JSON Lines from the last row back"""
+        kind = kind or self.detect(path)
+        if kind == 'json':
+            yield from self._json_array(path)
+            return
+        
+        with open(path, 'rb') as f:
+            header = None
+            if kind == 'csv':
+                # Some exports put a few lines of preamble above the header
+                for _ in range(20):
+                    line = f.readline()
+                    if not line:
+                        return
+                    names = next(csv.reader([line.decode('utf-8-sig')]), [])
+                    if {'symbol', 'amount'} <= self.columns(names).keys():
+                        header = names
+                        break
+                if header is None:
+                    raise ValueError("no recognizable header row")
+            lines = self._lines_reversed(f, f.tell()) if reverse else io.TextIOWrapper(f, 'utf-8-sig', newline='')
+            if kind == 'csv':
+                width = len(header)
+                for values in csv.reader(lines):
+                    if len(values) >= width:
+                        yield dict(zip(header, values))
+            else:
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
     
     @staticmethod
-    def menu_item(number: int, text: str, description: str = ""):
-        num = f"{Colors.BOLD}{Colors.WHITE}{number}{Colors.RESET}"
-        title = f"{Colors.WHITE}{text}{Colors.RESET}"
-        desc = f"{Colors.GRAY}{description}{Colors.RESET}" if description else ""
-        print(f"  {num}  {title}")
-        if desc:
-            print(f"     {desc}")
+    def _lines_reversed(f, start: int, block: int = 1 << 16):
+        """Lines from EOF back to byte offset `start`, last line first"""
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        rest = b''
+        while pos > start:
+            size = min(block, pos - start)
+            pos -= size
+            f.seek(pos)
+            lines = (f.read(size) + rest).split(b'\n')
+            rest = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode('utf-8') + '\n'
+        yield rest.decode('utf-8-sig') + '\n'
     
     @staticmethod
-    def divider():
-        print(f"{Colors.GRAY}{UI.line()}{Colors.RESET}")
+    def _json_array(path: str, block: int = 1 << 16):
+        """Items of a top-level JSON array, decoded incrementally"""
+        decoder = json.JSONDecoder()
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            buffer = f.read(block).lstrip()
+            if not buffer.startswith('['):
+                raise ValueError("expected a JSON array of trades")
+            buffer, eof = buffer[1:], False
+            while True:
+                buffer = buffer.lstrip().lstrip(',').lstrip()
+                if buffer.startswith(']'):
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except ValueError:
+                    if eof:
+                        raise
+                    chunk = f.read(block)
+                    eof = not chunk
+                    buffer += chunk
+                    continue
+                yield item
+                buffer = buffer[end:]
+    
+    def number(self, value) -> Optional[float]:
+        if value is None or value == '':
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            # "0.5BTC", "$1,234.50"
+            match = self.NUMBER.search(str(value).replace(',', ''))
+            return float(match.group()) if match else None
     
     @staticmethod
-    def space(lines=1):
-        print('\n' * (lines - 1))
+    def timestamp(value) -> Optional[str]:
+        if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+            seconds = float(value)
+            # Millisecond epochs from exchange APIs
+            if seconds > 1e11:
+                seconds /= 1000
+            return datetime.fromtimestamp(seconds).isoformat(timespec='seconds')
+        text = str(value or '').strip()[:19]
+        try:
+            parsed = datetime.fromisoformat(text)
+        except ValueError:
+            return None
+        # Already 'YYYY-MM-DD HH:MM:SS' or with a 'T'; skip re-formatting on the hot path
+        return f"{text[:10]}T{text[11:]}" if len(text) == 19 else parsed.isoformat(timespec='seconds')
+    
+    def split_symbol(self, text: str) -> Tuple[str, Optional[str]]:
+        """'BTCUSDT' / 'BTC-USD' / 'btc' -> (base symbol, quote currency or None)"""
+        if text not in self._symbols:
+            self._symbols[text] = self._split_symbol(text)
+        return self._symbols[text]
+    
+    def _split_symbol(self, text: str) -> Tuple[str, Optional[str]]:
+        text = text.strip().lower()
+        for separator in ('/', '-', '_'):
+            if separator in text:
+                base, quote = text.split(separator, 1)
+                return base, self.QUOTES.get(quote, quote)
+        for suffix in self._suffixes:
+            if text.endswith(suffix) and len(text) > len(suffix):
+                return text[:-len(suffix)], self.QUOTES[suffix]
+        return text, None
+    
+    def trades(self, rows):
+        """Normalize raw rows to (timestamp, side, symbol, amount, price); bad rows are counted and skipped"""
+        keys = None
+        report = self.report
+        for row in rows:
+            report['rows'] += 1
+            if row.keys() != keys:
+                # Missing fields map to None, and row.get(None) is None
+                keys, mapping = row.keys(), self.columns(row.keys())
+                c_timestamp, c_side, c_symbol, c_amount, c_price, c_total, c_quote = (
+                    mapping.get(field) for field, _ in self.COLUMNS)
+            
+            symbol = row.get(c_symbol)
+            amount = self.number(row.get(c_amount))
+            timestamp = self.timestamp(row.get(c_timestamp)) if c_timestamp else self.imported_at
+            if not symbol or not amount or not timestamp:
+                report['skipped'] += 1
+                continue
+            
+            side = str(row.get(c_side) or '').lower()
+            if 'buy' in side or 'bought' in side:
+                side = 'buy'
+            elif 'sell' in side or 'sold' in side:
+                side = 'sell'
+            elif not side:
+                side = 'buy' if amount > 0 else 'sell'
+            else:
+                # Deposits, withdrawals, rewards, conversions...
+                report['skipped'] += 1
+                continue
+            amount = abs(amount)
+            
+            symbol, quote = self.split_symbol(str(symbol))
+            quote = str(row.get(c_quote) or quote or '').strip().lower()
+            if quote and self.QUOTES.get(quote, quote) != self.currency:
+                report['other_currency'] += 1
+                continue
+            
+            price = self.number(row.get(c_price))
+            if price is None:
+                total = self.number(row.get(c_total))
+                price = abs(total) / amount if total is not None else None
+            if price is None and side == 'buy':
+                report['skipped'] += 1
+                continue
+            yield timestamp, side, symbol, amount, price
+    
+    def transactions(self, trades):
+        """Resolve symbols to coin ids and build ledger transactions"""
+        unknown = self.report['unknown_symbols']
+        for timestamp, side, symbol, amount, price in trades:
+            if symbol not in self._ids:
+                self._ids[symbol] = self.resolve(symbol)
+            crypto_id = self._ids[symbol]
+            if crypto_id is None:
+                unknown[symbol] = unknown.get(symbol, 0) + 1
+                continue
+            yield TransactionLedger.make(side, crypto_id, amount, price, timestamp)
+    
+    def fold(self, txns, holdings: Dict):
+        """Apply each transaction to `holdings` as it passes through"""
+        for txn in txns:
+            TransactionLedger.apply(holdings, txn)
+            self.report['imported'] += 1
+            yield txn
+    
+    def newest_first(self, path: str, kind: Optional[str] = None) -> bool:
+        """Whether the export lists trades newest first (as Binance does)"""
+        if (kind or self.detect(path)) == 'json':
+            return False
+        probe = TradeImporter(self.resolve, self.currency)
+        first = next(probe.trades(probe.rows(path, kind)), None)
+        last = next(probe.trades(probe.rows(path, kind, reverse=True)), None)
+        return bool(first and last and first[0] > last[0])
+    
+    def pipeline(self, path: str, holdings: Dict, kind: Optional[str] = None):
+        """Chronological transactions from `path`, folded into `holdings` as they are consumed"""
+        rows = self.rows(path, kind, reverse=self.newest_first(path, kind))
+        return self.fold(self.transactions(self.trades(rows)), holdings)
 
 
 class CryptoTracker:
     
-    def __init__(self):
-        self.api_base = "https://api.coingecko.com/api/v3"
+    def __init__(self, storage=None, portfolio_name: str = DEFAULT_PORTFOLIO, api_base: str = API_BASE):
+        self.api_base = api_base
         self.portfolio: Dict = {}
-        self.portfolio_file = 'portfolio.json'
-        self.settings_file = 'settings.json'
+        self.portfolio_name = check_portfolio_name(portfolio_name)
+        self.storage = storage or JsonStorage()
+        self.price_cache = PriceCache(store=self.storage)
+        self.history = PriceHistoryStore(os.path.join(self.storage.directory, HISTORY_DIR))
+        self.performance = PerformanceReport(self.history)
+        self.projection = GoalProjection(self.history)
+        self.coin_index = CoinIndex(os.path.join(self.storage.directory, COIN_INDEX_FILE))
+        self.http = ApiClient()
+        self.alerts = AlertEngine(post=self.http.session.post)
+        self.fetcher = AsyncPriceFetcher(get=self.http.get, concurrency=min(MAX_CONCURRENT_REQUESTS, HTTP_POOL_SIZE),
+                                         timeout=self.http.timeout)
+        # Concurrent lookups of the same (coin, currency) share one upstream request
+        self.flight = SingleFlight()
+        self.source: PriceSource = PollingSource(self._fetch_shared)
+        self.stream: Optional[PriceSource] = None
+        self._revalidating: set = set()
+        self._revalidate_lock = threading.Lock()
+        # Transactions applied in memory but not yet on disk, per portfolio: (txns, holdings)
+        self.writes = WriteBehind()
+        self._unsaved: Dict[str, Tuple[List[Dict], Dict]] = {}
+        self._unsaved_lock = threading.RLock()
+        METRICS.sources.update({
+            'price_cache': self.price_cache.stats,
+            'http': self.http.stats,
+            'fetcher': self.fetcher.stats,
+            'price_flight': self.flight.stats,
+            'writes': self.writes.stats
+        })
         self.currency = 'usd'  # Default currency
+        self.currencies = list(SUPPORTED_CURRENCIES)  # Quoted together on every fetch
         self.goals = {
             'target_value': 0,
             'target_date': '',
             'initial_investment': 0
         }
+        # Set once a recovery note has been shown, so the interactive menu can hold it on screen
+        self.recovery_reported = False
         self.load_portfolio()
         self.load_settings()
     
+    def attach_stream(self, stream: PriceSource):
+        """Serve quotes from a live feed first; coins it lacks (or has gone quiet on) are polled"""
+        self.stream = stream
+        METRICS.sources['stream'] = stream.stats
+    
+    @instrumented('load_portfolio')
     def load_portfolio(self):
-        if os.path.exists(self.portfolio_file):
-            try:
-                with open(self.portfolio_file, 'r') as f:
-                    self.portfolio = json.load(f)
-                UI.success("Portfolio loaded")
-            except:
-                self.portfolio = {}
+        # Unreadable files are recovered by the storage; anything it cannot recover is raised, never reset to empty
+        self.flush()
+        if self.storage.has_portfolio(self.portfolio_name):
+            self.portfolio = self.storage.load_holdings(self.portfolio_name)
+            self._report_recovery()
+            UI.success("Portfolio loaded")
         else:
             self.portfolio = {}
     
+    def _report_recovery(self):
+        for note in self.storage.recovered:
+            UI.error(note)
+            self.recovery_reported = True
+        self.storage.recovered.clear()
+    
+    @instrumented('load_settings')
     def load_settings(self):
-        if os.path.exists(self.settings_file):
+        try:
+            data = self.storage.load_settings()
+        except (OSError, sqlite3.Error) as e:
+            self.storage.recovered.append(f"Could not read settings ({e}); using defaults")
+            data = {}
+        if not isinstance(data, dict):
+            self.storage.recovered.append("Settings are not a JSON object; using defaults")
+            data = {}
+        self.currency = data.get('currency', 'usd')
+        self.currencies = data.get('currencies', self.currencies)
+        self.goals = data.get('goals', self.goals)
+        for rule in data.get('alerts', []):
             try:
-                with open(self.settings_file, 'r') as f:
-                    data = json.load(f)
-                    self.currency = data.get('currency', 'usd')
-                    self.goals = data.get('goals', self.goals)
-            except:
-                pass
+                self.alerts.add(rule['kind'], rule['coin'], rule['threshold'], rule['currency'],
+                                rule.get('reference'), rule['id'])
+            except (KeyError, TypeError, ValueError) as e:
+                self.storage.recovered.append(f"Skipped malformed alert rule {rule!r} ({e})")
+        self._report_recovery()
     
+    @instrumented('save_settings')
     def save_settings(self):
-        with open(self.settings_file, 'w') as f:
-            json.dump({
-                'currency': self.currency,
-                'goals': self.goals
-            }, f, indent=2)
+        self.storage.save_settings({
+            'currency': self.currency,
+            'currencies': self.currencies,
+            'goals': self.goals,
+            'alerts': self.alerts.to_list()
+        })
     
+    @instrumented('save_portfolio')
     def save_portfolio(self):
-        with open(self.portfolio_file, 'w') as f:
-            json.dump(self.portfolio, f, indent=2)
+        # Holdings changes are already durable in the transaction history; this writes a snapshot
+        self.flush()
+        with self._unsaved_lock:
+            self.storage.save_holdings(self.portfolio_name, self.portfolio)
+    
+    def flush(self):
+        """Write out transactions still held back by write debouncing"""
+        self.writes.flush()
+    
+    def save_changes(self) -> bool:
+        """flush(), reporting a failed write to the user instead of raising"""
+        try:
+            self.flush()
+        except (OSError, sqlite3.Error) as e:
+            UI.error(f"Could not save changes: {e}")
+            return False
+        finally:
+            self._report_recovery()
+        return True
+    
+    def holdings(self, portfolio: Optional[str] = None) -> Dict:
+        """Holdings of a named portfolio; the current one (and any with unsaved changes) is served from memory"""
+        if portfolio is None or portfolio == self.portfolio_name:
+            return self.portfolio
+        check_portfolio_name(portfolio)
+        with self._unsaved_lock:
+            if portfolio in self._unsaved:
+                return self._unsaved[portfolio][1]
+        return self.storage.load_holdings(portfolio) if self.storage.has_portfolio(portfolio) else {}
+    
+    @instrumented('record_transaction')
+    def record_transaction(self, txn: Dict, portfolio: Optional[str] = None) -> Dict:
+        """Apply a transaction now; it reaches the disk with any others made within WRITE_DEBOUNCE"""
+        name = portfolio or self.portfolio_name
+        with self._unsaved_lock:
+            holdings = self.holdings(name)
+            TransactionLedger.apply(holdings, txn)
+            self._unsaved.setdefault(name, ([], holdings))[0].append(txn)
+        self.writes.schedule(('record', name), functools.partial(self._write_unsaved, name))
+        return holdings
+    
+    def _write_unsaved(self, name: str):
+        with self._unsaved_lock:
+            if name in self._unsaved:
+                txns, holdings = self._unsaved[name]
+                self.storage.record(name, txns, holdings)
+                del self._unsaved[name]
     
+    def transactions(self, portfolio: Optional[str] = None) -> List[Dict]:
+        self.flush()
+        return self.storage.transactions(portfolio or self.portfolio_name)
+    
+    @instrumented('get_price')
     def get_price(self, crypto_id: str) -> Optional[Dict]:
+        return self.get_prices([crypto_id]).get(crypto_id)
+    
+    @instrumented('get_prices')
+    def get_prices(self, crypto_ids: List[str], refresh: bool = False,
+                   currency: Optional[str] = None) -> Dict[str, Dict]:
+        """Fetch prices for many coins, batching ids into as few requests as possible.
+        
+        Every configured currency is requested alongside `currency` and cached, so
+        switching currency or showing other totals needs no further calls. Recently
+        expired quotes are served immediately (marked 'stale' with their 'age') and
+        refreshed in the background; if the API is unreachable the last known quote
+        is served the same way.
+        """
+        currency = currency or self.currency
+        prices = self.stream.quotes(crypto_ids, currency) if self.stream else {}
+        missing = []
+        revalidate = []
+        for crypto_id in crypto_ids:
+            if crypto_id in prices:
+                continue
+            cached = None if refresh else self.price_cache.get(crypto_id, currency)
+            if cached is not None:
+                prices[crypto_id] = cached
+                continue
+            stale = None if refresh else self.price_cache.get_stale(crypto_id, currency)
+            if stale and stale[1] <= self.price_cache.ttl + PRICE_STALE_GRACE:
+                prices[crypto_id] = dict(stale[0], stale=True, age=stale[1])
+                revalidate.append(crypto_id)
+            else:
+                missing.append(crypto_id)
+        
+        if revalidate:
+            self._revalidate_in_background(revalidate, currency)
+        
+        if missing:
+            if self.http.breaker.state != 'open':
+                prices.update(self.source.quotes(missing, currency))
+            for crypto_id in missing:
+                if crypto_id not in prices:
+                    stale = self.price_cache.get_stale(crypto_id, currency)
+                    if stale:
+                        prices[crypto_id] = dict(stale[0], stale=True, age=stale[1])
+        
+        return prices
+    
+    @property
+    def offline(self) -> bool:
+        return self.http.breaker.state == 'open'
+    
+    def _revalidate_in_background(self, crypto_ids: List[str], currency: str):
+        with self._revalidate_lock:
+            crypto_ids = [crypto_id for crypto_id in crypto_ids if (crypto_id, currency) not in self._revalidating]
+            self._revalidating.update((crypto_id, currency) for crypto_id in crypto_ids)
+        if not crypto_ids:
+            return
+        
+        def revalidate():
+            try:
+                self._fetch_shared(crypto_ids, currency, quiet=True)
+            finally:
+                with self._revalidate_lock:
+                    self._revalidating.difference_update((crypto_id, currency) for crypto_id in crypto_ids)
+        
+        threading.Thread(target=revalidate, daemon=True).start()
+    
+    def _fetch_shared(self, crypto_ids: List[str], currency: str, quiet: bool = False) -> Dict[str, Dict]:
+        """_fetch_quotes, except coins another thread is already fetching wait for that result"""
+        def fetch(keys):
+            prices = self._fetch_quotes([crypto_id for crypto_id, _ in keys], currency, quiet)
+            return {(crypto_id, currency): quote for crypto_id, quote in prices.items()}
+        
+        shared = self.flight.do_many([(crypto_id, currency) for crypto_id in crypto_ids], fetch)
+        return {crypto_id: quote for (crypto_id, _), quote in shared.items()}
+    
+    def _fetch_quotes(self, crypto_ids: List[str], currency: str, quiet: bool = False) -> Dict[str, Dict]:
+        prices = {}
+        currencies = list(dict.fromkeys([currency, self.currency] + self.currencies))
+        url = f"{self.api_base}/simple/price"
+        batches = list(self._chunk_ids(crypto_ids))
+        param_sets = [{
+            'ids': ','.join(batch),
+            'vs_currencies': ','.join(currencies),
+            'include_24hr_change': 'true',
+            'include_market_cap': 'true'
+        } for batch in batches]
+        
+        errors = []
+        fetched = {code: {} for code in currencies}
+        for batch, data in zip(batches, self.fetcher.fetch_all(url, param_sets)):
+            if isinstance(data, Exception):
+                errors.append(data)
+                continue
+            for crypto_id in batch:
+                for code in currencies:
+                    if crypto_id in data and code in data[crypto_id]:
+                        quote = {
+                            'price': data[crypto_id][code],
+                            'change_24h': data[crypto_id].get(f'{code}_24h_change', 0),
+                            'market_cap': data[crypto_id].get(f'{code}_market_cap', 0)
+                        }
+                        self.price_cache.put(crypto_id, code, quote)
+                        fetched[code][crypto_id] = quote['price']
+                        if code == currency:
+                            prices[crypto_id] = quote
+        
+        for code, code_prices in fetched.items():
+            if code_prices:
+                self.history.record(code, code_prices)
+        
+        if errors and not quiet:
+            UI.error(f"Connection error: {str(errors[0])}")
+        
+        if any(fetched.values()):
+            self.writes.schedule('history', self.history.flush)
+        if fetched[currency]:
+            self.writes.schedule('prices', self.price_cache.persist)
+        return prices
+    
+    def backfill_history(self, crypto_id: str, days: int = 365) -> int:
+        """Pull historical prices from /market_chart into the local history store"""
         try:
-            url = f"{self.api_base}/simple/price"
-            params = {
-                'ids': crypto_id,
-                'vs_currencies': self.currency,
-                'include_24hr_change': 'true',
-                'include_market_cap': 'true'
-            }
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
-            
-            if crypto_id in data:
-                return {
-                    'price': data[crypto_id][self.currency],
-                    'change_24h': data[crypto_id].get(f'{self.currency}_24h_change', 0),
-                    'market_cap': data[crypto_id].get(f'{self.currency}_market_cap', 0)
-                }
-            return None
+            url = f"{self.api_base}/coins/{crypto_id}/market_chart"
+            response = self.http.get(url, params={'vs_currency': self.currency, 'days': days})
+            points = np.asarray(response.json().get('prices', []), dtype=np.float64).reshape(-1, 2)
         except Exception as e:
-            UI.error(f"Connection error: {str(e)}")
-            return None
+            UI.error(f"Could not fetch history: {str(e)}")
+            return 0
+        
+        self.history.merge(crypto_id, self.currency, points[:, 0] / 1000, points[:, 1])
+        # Cached daily valuations may have been made without these older prices
+        self.performance.invalidate()
+        return len(points)
     
-    def get_currency_symbol(self):
+    @staticmethod
+    def _chunk_ids(crypto_ids: List[str]):
+        # Keep each request well under common URL length limits
+        batch, length = [], 0
+        for crypto_id in dict.fromkeys(crypto_ids):
+            if batch and (len(batch) >= MAX_IDS_PER_REQUEST or length + len(crypto_id) + 1 > MAX_IDS_LENGTH):
+                yield batch
+                batch, length = [], 0
+            batch.append(crypto_id)
+            length += len(crypto_id) + 1
+        if batch:
+            yield batch
+    
+    def get_currency_symbol(self, currency: Optional[str] = None):
         symbols = {
             'usd': '$',
             'inr': '₹',
             'eur': '€',
             'gbp': '£'
         }
-        return symbols.get(self.currency, '$')
+        return symbols.get(currency or self.currency, '$')
     
-    def get_currency_name(self):
+    def get_currency_name(self, currency: Optional[str] = None):
         names = {
             'usd': 'USD',
             'inr': 'INR',
             'eur': 'EUR',
             'gbp': 'GBP'
         }
-        return names.get(self.currency, 'USD')
+        return names.get(currency or self.currency, 'USD')
     
     def switch_currency(self):
         UI.clear()
         UI.header("CURRENCY SETTINGS")
         
-        print(f"{Colors.GRAY}Current: {Colors.WHITE}{self.get_currency_name()}{Colors.RESET}\n")
+        UI.write(f"{Colors.GRAY}Current: {Colors.WHITE}{self.get_currency_name()}{Colors.RESET}\n")
         
         currencies = {
             '1': ('usd', 'USD - US Dollar'),
@@ -186,9 +2953,9 @@ class CryptoTracker:
         
         for key, (code, name) in currencies.items():
             current = " (current)" if code == self.currency else ""
-            print(f"{Colors.GRAY}{key}.{Colors.RESET} {Colors.WHITE}{name}{Colors.RESET}{Colors.GRAY}{current}{Colors.RESET}")
+            UI.write(f"{Colors.GRAY}{key}.{Colors.RESET} {Colors.WHITE}{name}{Colors.RESET}{Colors.GRAY}{current}{Colors.RESET}")
         
-        print()
+        UI.write()
         choice = UI.prompt("Select currency")
         
         if choice in currencies:
@@ -198,18 +2965,47 @@ class CryptoTracker:
         else:
             UI.error("Invalid choice")
         
-        time.sleep(1.5)
+        UI.pause(1.5)
+    
+    def fetch_coin_list(self) -> List[Dict]:
+        response = self.http.get(f"{self.api_base}/coins/list", timeout=30)
+        response.raise_for_status()
+        return response.json()
+    
+    def refresh_coin_index(self):
+        """Long-running sessions refresh an old or missing coin list in the background"""
+        if self.coin_index.stale:
+            self.coin_index.refresh_in_background(self.fetch_coin_list)
+    
+    def resolve_coin(self, text: str, wait: bool = False) -> str:
+        """Turn a symbol like 'btc' into its CoinGecko id; unknown text is returned as-is.
+        
+        With `wait` a missing coin list is downloaded (and saved) first, for one-shot callers
+        that won't live long enough for a background refresh.
+        """
+        if wait:
+            self.coin_index.ensure(self.fetch_coin_list)
+        return self.coin_index.resolve(text, prefer=list(self.portfolio)) or text.strip().lower()
     
+    @instrumented('search')
     def search(self, query: str) -> List[Dict]:
+        if self.coin_index.ready:
+            return self.coin_index.search(query)
+        
         try:
             url = f"{self.api_base}/search"
-            response = requests.get(url, params={'query': query}, timeout=10)
+            response = self.http.get(url, params={'query': query})
             data = response.json()
             return data.get('coins', [])[:5]
         except:
             return []
     
-    def add_holding(self, crypto_id: str, amount: float, purchase_price: Optional[float] = None):
+    def add_holding(self, crypto_id: str, amount: float, purchase_price: Optional[float] = None,
+                    portfolio: Optional[str] = None):
+        if not amount > 0:
+            UI.error("Amount must be positive")
+            return False
+        
         price_data = self.get_price(crypto_id)
         
         if not price_data:
@@ -217,91 +3013,87 @@ class CryptoTracker:
             return False
         
         if purchase_price is None:
+            if price_data.get('stale'):
+                UI.error("Only a stale price is available; enter a purchase price")
+                return False
             purchase_price = price_data['price']
         
-        if crypto_id in self.portfolio:
-            # Update existing
-            old_amount = self.portfolio[crypto_id]['amount']
-            old_avg = self.portfolio[crypto_id]['avg_price']
-            new_amount = old_amount + amount
-            new_avg = ((old_avg * old_amount) + (purchase_price * amount)) / new_amount
-            
-            self.portfolio[crypto_id]['amount'] = new_amount
-            self.portfolio[crypto_id]['avg_price'] = new_avg
-        else:
-            # Add new
-            self.portfolio[crypto_id] = {
-                'amount': amount,
-                'avg_price': purchase_price,
-                'added': datetime.now().strftime("%Y-%m-%d")
-            }
-        
-        self.save_portfolio()
+        self.record_transaction(TransactionLedger.make('buy', crypto_id, amount, purchase_price), portfolio)
         UI.success(f"Added {amount} {crypto_id.upper()}")
         return True
     
-    def remove_holding(self, crypto_id: str, amount: Optional[float] = None):
+    @instrumented('import_trades')
+    def import_trades(self, path: str, kind: Optional[str] = None) -> Dict:
+        """Import an exchange trade export in one streaming pass and a single commit"""
+        if not self.coin_index.ensure(self.fetch_coin_list):
+            raise ValueError("coin list unavailable; symbols cannot be mapped to ids")
+        
+        start = time.perf_counter()
+        importer = TradeImporter(lambda symbol: self.coin_index.resolve(symbol, prefer=list(holdings)), self.currency)
+        # Held-back transactions belong before the imported ones
+        self.flush()
+        holdings = {crypto_id: dict(holding) for crypto_id, holding in self.portfolio.items()}
+        self.storage.import_transactions(self.portfolio_name, importer.pipeline(path, holdings, kind), holdings)
+        self.portfolio = holdings
+        
+        report = importer.report
+        report['holdings'] = len(holdings)
+        report['seconds'] = round(time.perf_counter() - start, 3)
+        return report
+    
+    def remove_holding(self, crypto_id: str, amount: Optional[float] = None, sale_price: Optional[float] = None,
+                       portfolio: Optional[str] = None):
         """Remove cryptocurrency from portfolio"""
-        if crypto_id not in self.portfolio:
+        if amount is not None and not amount > 0:
+            UI.error("Amount must be positive")
+            return False
+        
+        holdings = self.holdings(portfolio)
+        if crypto_id not in holdings:
             UI.error("Not in portfolio")
             return False
         
-        if amount is None or amount >= self.portfolio[crypto_id]['amount']:
-            del self.portfolio[crypto_id]
+        held = holdings[crypto_id]['amount']
+        sold = held if amount is None else min(amount, held)
+        holdings = self.record_transaction(TransactionLedger.make('sell', crypto_id, sold, sale_price), portfolio)
+        
+        if crypto_id not in holdings:
             UI.success(f"Removed {crypto_id.upper()}")
         else:
-            self.portfolio[crypto_id]['amount'] -= amount
             UI.success(f"Removed {amount} {crypto_id.upper()}")
         
-        self.save_portfolio()
         return True
     
+    @instrumented('render_portfolio')
     def display_portfolio(self):
         UI.clear()
         currency_display = f"{self.get_currency_name()}"
+        if self.portfolio_name != DEFAULT_PORTFOLIO:
+            currency_display += f", {self.portfolio_name}"
         UI.header(f"PORTFOLIO ({currency_display})")
         
         if not self.portfolio:
-            print(f"{Colors.GRAY}{'No holdings yet'.center(60)}{Colors.RESET}")
+            UI.write(f"{Colors.GRAY}{'No holdings yet'.center(60)}{Colors.RESET}")
             UI.space(2)
             return
         
-        total_value = 0
-        total_invested = 0
-        holdings_data = []
+        valuation = self.value_portfolio()
         symbol = self.get_currency_symbol()
         
-        # Fetch all data
-        for crypto_id, holding in self.portfolio.items():
-            price_data = self.get_price(crypto_id)
-            if price_data:
-                holdings_data.append({
-                    'id': crypto_id,
-                    'amount': holding['amount'],
-                    'avg_price': holding['avg_price'],
-                    'current_price': price_data['price'],
-                    'change_24h': price_data['change_24h']
-                })
-                time.sleep(0.3)  # Rate limiting
+        if self.offline:
+            UI.write(f"{Colors.YELLOW}{'Offline - showing last known prices'.center(60)}{Colors.RESET}\n")
         
         # Display each holding
-        for data in holdings_data:
+        for data in valuation.rows():
             crypto_id = data['id']
             amount = data['amount']
-            avg_price = data['avg_price']
-            current_price = data['current_price']
+            value = data['value']
+            profit = data['profit']
+            profit_pct = data['profit_pct']
             change_24h = data['change_24h']
             
-            value = current_price * amount
-            invested = avg_price * amount
-            profit = value - invested
-            profit_pct = (profit / invested * 100) if invested > 0 else 0
-            
-            total_value += value
-            total_invested += invested
-            
             # Crypto name
-            print(f"{Colors.BOLD}{Colors.WHITE}{crypto_id.upper()}{Colors.RESET}")
+            UI.write(f"{Colors.BOLD}{Colors.WHITE}{crypto_id.upper()}{Colors.RESET}")
             
             # Holdings
             UI.info("Holdings", f"{amount:.8f}".rstrip('0').rstrip('.'))
@@ -319,18 +3111,40 @@ class CryptoTracker:
             change_sign = "+" if change_24h >= 0 else ""
             UI.info("24h", f"{change_sign}{change_24h:.2f}%", change_color)
             
-            print()
+            # Share of portfolio
+            UI.info("Weight", f"{data['weight'] * 100:.2f}%", Colors.GRAY)
+            
+            if data['quote_age'] is not None:
+                UI.info("Quote", f"last known, {UI.age(data['quote_age'])} old", Colors.YELLOW)
+            
+            UI.write()
         
         # Summary
         UI.divider()
-        total_profit = total_value - total_invested
-        total_profit_pct = (total_profit / total_invested * 100) if total_invested > 0 else 0
+        total_value = valuation.total_value
+        total_profit = valuation.total_profit
+        total_profit_pct = valuation.total_profit_pct
         summary_color = Colors.GREEN if total_profit >= 0 else Colors.RED
         
         UI.info("Total Value", f"{symbol}{total_value:,.2f}", Colors.BOLD + Colors.WHITE)
         sign = "+" if total_profit >= 0 else ""
         UI.info("Total P/L", f"{sign}{symbol}{total_profit:,.2f} ({sign}{total_profit_pct:.2f}%)", summary_color)
         
+        change = valuation.total_change_24h
+        change_color = Colors.GREEN if change >= 0 else Colors.RED
+        sign = "+" if change >= 0 else ""
+        UI.info("Total 24h", f"{sign}{symbol}{change:,.2f} ({sign}{valuation.total_change_24h_pct:.2f}%)", change_color)
+        
+        # Same holdings in the other configured currencies (already cached by the fetch above)
+        for currency, total in self.portfolio_totals().items():
+            if currency != self.currency:
+                UI.info(f"  in {self.get_currency_name(currency)}", f"{self.get_currency_symbol(currency)}{total:,.2f}", Colors.GRAY)
+        
+        if valuation.stale:
+            UI.info("Stale quotes", f"{len(valuation.stale)}, oldest {UI.age(max(valuation.stale.values()))}", Colors.YELLOW)
+        if valuation.unpriced:
+            UI.error(f"No price for: {', '.join(crypto_id.upper() for crypto_id in valuation.unpriced)}")
+        
         # Show goals progress if set
         if self.goals['target_value'] > 0:
             UI.space()
@@ -338,23 +3152,127 @@ class CryptoTracker:
         
         UI.space(2)
     
+    def list_portfolios(self) -> List[str]:
+        return sorted(set(self.storage.list_portfolios()) | set(self._unsaved) | {self.portfolio_name})
+    
+    def switch_portfolio(self, name: str):
+        """Make another named portfolio current; one that doesn't exist yet starts empty"""
+        self.portfolio_name = check_portfolio_name(name)
+        self.load_portfolio()
+    
+    @instrumented('rollup')
+    def rollup(self, names: Optional[List[str]] = None, refresh: bool = False,
+               currency: Optional[str] = None) -> PortfolioRollup:
+        """Value several portfolios with one price lookup for the union of their coins"""
+        currency = currency or self.currency
+        holdings = {name: self.holdings(name) for name in (names or self.list_portfolios())}
+        crypto_ids = list(dict.fromkeys(crypto_id for portfolio in holdings.values() for crypto_id in portfolio))
+        prices = self.get_prices(crypto_ids, refresh, currency) if crypto_ids else {}
+        return PortfolioRollup(holdings, prices, currency)
+    
+    @instrumented('value_portfolio')
+    def value_portfolio(self, refresh: bool = False, currency: Optional[str] = None) -> PortfolioValuation:
+        currency = currency or self.currency
+        prices = self.get_prices(list(self.portfolio.keys()), refresh, currency)
+        return PortfolioValuation.from_prices(self.portfolio, prices, currency)
+    
+    @instrumented('performance_report')
+    def performance_report(self, start: Optional[str] = None, end: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+        txns = self.transactions()
+        return self.performance.report(self.portfolio_name, self.currency, txns, start, end)
+    
+    def portfolio_totals(self) -> Dict[str, float]:
+        """Total value in every configured currency, served from the quotes of a single fetch"""
+        return {currency: self.value_portfolio(currency=currency).total_value
+                for currency in dict.fromkeys([self.currency] + self.currencies)}
+    
+    def check_alerts(self) -> List[Dict]:
+        """One polling round: a single batched fetch for every watched coin, then threshold checks"""
+        self._arm_goal_alert()
+        fired = []
+        for currency, coins in self.alerts.watched().items():
+            prices = self.get_prices(coins, refresh=True, currency=currency)
+            for crypto_id, quote in prices.items():
+                if not quote.get('stale'):
+                    fired.extend(self.alerts.check(crypto_id, currency, quote['price']))
+        for currency in dict.fromkeys([self.currency] + self.currencies):
+            if self.portfolio and self.alerts.needs_portfolio(currency):
+                valuation = self.value_portfolio(currency=currency)
+                # Only judge the total when every holding has a live quote
+                if not valuation.stale and not valuation.unpriced:
+                    fired.extend(self.alerts.check(PORTFOLIO_KEY, currency, valuation.total_value))
+        
+        if fired:
+            if any(alert['id'] == 'goal' for alert in fired):
+                self.goals['alerted'] = self.goals['target_value']
+            self.alerts.deliver(fired)
+            self.save_settings()
+        return fired
+    
+    def _arm_goal_alert(self):
+        # The investment goal doubles as a portfolio-value alert; it fires once per target value
+        if (self.goals['target_value'] > 0 and 'goal' not in self.alerts.rules
+                and self.goals.get('alerted') != self.goals['target_value']):
+            self.alerts.add('above', PORTFOLIO_KEY, self.goals['target_value'], self.currency, rule_id='goal')
+    
+    def watch_alerts(self, interval: float = ALERT_INTERVAL, stop: Optional[threading.Event] = None):
+        stop = stop or threading.Event()
+        self._arm_goal_alert()
+        while not stop.is_set() and self.alerts.rules:
+            self.check_alerts()
+            UI.flush()
+            stop.wait(interval)
+    
+    def goal_progress(self, current_value: float) -> Dict:
+        target = self.goals['target_value']
+        initial = self.goals['initial_investment']
+        progress = {
+            'target_value': target,
+            'target_date': self.goals['target_date'],
+            'initial_investment': initial,
+            'current_value': current_value,
+            'progress_pct': (current_value / target * 100) if target > 0 else 0,
+            'remaining': target - current_value,
+            'days_left': None,
+            'roi_pct': ((current_value - initial) / initial * 100) if initial > 0 else None
+        }
+        if self.goals['target_date']:
+            try:
+                target_date = datetime.strptime(self.goals['target_date'], "%Y-%m-%d")
+                progress['days_left'] = (target_date - datetime.now()).days
+            except ValueError:
+                pass
+        return progress
+    
+    @instrumented('project_goal')
+    def project_goal(self, paths: int = PROJECTION_PATHS, workers: int = 1, seed: Optional[int] = None,
+                     valuation: Optional[PortfolioValuation] = None) -> Optional[Dict]:
+        """Chance of the portfolio reaching the target value by the target date, or None without both"""
+        days_left = self.goal_progress(0)['days_left']
+        if self.goals['target_value'] <= 0 or days_left is None or not self.portfolio:
+            return None
+        valuation = valuation or self.value_portfolio()
+        holdings_value = dict(zip(valuation.ids, valuation.value.tolist()))
+        return self.projection.project(holdings_value, self.currency, self.goals['target_value'],
+                                       max(0, days_left), paths, workers, seed)
+    
     def display_trending(self):
         UI.clear()
         UI.header("TRENDING")
         
         try:
             url = f"{self.api_base}/search/trending"
-            response = requests.get(url, timeout=10)
+            response = self.http.get(url)
             data = response.json()
             
             if 'coins' in data:
                 for i, item in enumerate(data['coins'][:7], 1):
                     coin = item['item']
                     rank = coin.get('market_cap_rank', 'N/A')
-                    print(f"{Colors.GRAY}{i}.{Colors.RESET} {Colors.WHITE}{coin['name']}{Colors.RESET} {Colors.GRAY}{coin['symbol'].upper()}{Colors.RESET}")
-                    print(f"   {Colors.GRAY}Rank #{rank}{Colors.RESET}")
+                    UI.write(f"{Colors.GRAY}{i}.{Colors.RESET} {Colors.WHITE}{coin['name']}{Colors.RESET} {Colors.GRAY}{coin['symbol'].upper()}{Colors.RESET}")
+                    UI.write(f"   {Colors.GRAY}Rank #{rank}{Colors.RESET}")
                     if i < 7:
-                        print()
+                        UI.write()
         except:
             UI.error("Could not fetch trending data")
         
@@ -368,8 +3286,10 @@ class CryptoTracker:
         symbol = self.get_currency_symbol()
         
         if price_data:
-            print(f"{Colors.BOLD}{Colors.WHITE}{crypto_id.upper()}{Colors.RESET}\n")
+            UI.write(f"{Colors.BOLD}{Colors.WHITE}{crypto_id.upper()}{Colors.RESET}\n")
             UI.info("Price", f"{symbol}{price_data['price']:,.2f}", Colors.WHITE)
+            if price_data.get('stale'):
+                UI.info("Quote", f"last known, {UI.age(price_data['age'])} old", Colors.YELLOW)
             
             change = price_data['change_24h']
             change_color = Colors.GREEN if change >= 0 else Colors.RED
@@ -387,7 +3307,7 @@ class CryptoTracker:
         UI.clear()
         UI.header("INVESTMENT GOALS")
         
-        print(f"{Colors.GRAY}Set your crypto investment targets{Colors.RESET}\n")
+        UI.write(f"{Colors.GRAY}Set your crypto investment targets{Colors.RESET}\n")
         
         try:
             symbol = self.get_currency_symbol()
@@ -414,7 +3334,7 @@ class CryptoTracker:
             
             # Show summary
             if self.goals['target_value'] > 0:
-                print()
+                UI.write()
                 UI.info("Target", f"{symbol}{self.goals['target_value']:,.2f}")
                 if self.goals['target_date']:
                     UI.info("Target Date", self.goals['target_date'])
@@ -424,7 +3344,7 @@ class CryptoTracker:
         except ValueError:
             UI.error("Invalid input format")
         
-        time.sleep(2)
+        UI.pause(2)
     
     def show_goals_progress(self, current_value: float):
         if self.goals['target_value'] <= 0:
@@ -436,7 +3356,7 @@ class CryptoTracker:
         remaining = target - current_value
         
         UI.divider()
-        print(f"{Colors.BOLD}{Colors.WHITE}Investment Goal Progress{Colors.RESET}\n")
+        UI.write(f"{Colors.BOLD}{Colors.WHITE}Investment Goal Progress{Colors.RESET}\n")
         
         UI.info("Target", f"{symbol}{target:,.2f}")
         UI.info("Current", f"{symbol}{current_value:,.2f}")
@@ -452,7 +3372,7 @@ class CryptoTracker:
         bar = "█" * filled + "░" * (bar_length - filled)
         progress_color = Colors.GREEN if progress_pct >= 100 else Colors.CYAN
         
-        print(f"{Colors.GRAY}Progress{' ' * 10}{Colors.RESET}{progress_color}{bar} {progress_pct:.1f}%{Colors.RESET}")
+        UI.write(f"{Colors.GRAY}Progress{' ' * 10}{Colors.RESET}{progress_color}{bar} {progress_pct:.1f}%{Colors.RESET}")
         
         # Days until target
         if self.goals['target_date']:
@@ -474,21 +3394,16 @@ class CryptoTracker:
         UI.header("MY INVESTMENT GOALS")
         
         if self.goals['target_value'] <= 0:
-            print(f"{Colors.GRAY}{'No goals set yet'.center(60)}{Colors.RESET}\n")
-            print(f"{Colors.GRAY}Use option 7 to set your goals!{Colors.RESET}")
+            UI.write(f"{Colors.GRAY}{'No goals set yet'.center(60)}{Colors.RESET}\n")
+            UI.write(f"{Colors.GRAY}Use option 7 to set your goals!{Colors.RESET}")
             UI.space(2)
             return
         
         symbol = self.get_currency_symbol()
         
         # Calculate current portfolio value
-        current_value = 0
-        if self.portfolio:
-            for crypto_id, holding in self.portfolio.items():
-                price_data = self.get_price(crypto_id)
-                if price_data:
-                    current_value += price_data['price'] * holding['amount']
-                time.sleep(0.3)
+        valuation = self.value_portfolio() if self.portfolio else None
+        current_value = valuation.total_value if valuation else 0
         
         # Show goals
         UI.info("Target Value", f"{symbol}{self.goals['target_value']:,.2f}", Colors.WHITE)
@@ -497,7 +3412,7 @@ class CryptoTracker:
         if self.goals['initial_investment'] > 0:
             UI.info("Initial Investment", f"{symbol}{self.goals['initial_investment']:,.2f}", Colors.WHITE)
         
-        print()
+        UI.write()
         
         # Show progress
         self.show_goals_progress(current_value)
@@ -507,12 +3422,315 @@ class CryptoTracker:
             roi = ((current_value - self.goals['initial_investment']) / self.goals['initial_investment'] * 100)
             roi_color = Colors.GREEN if roi >= 0 else Colors.RED
             sign = "+" if roi >= 0 else ""
-            print()
+            UI.write()
             UI.info("ROI", f"{sign}{roi:.2f}%", roi_color)
         
+        projection = self.project_goal(valuation=valuation) if valuation else None
+        if projection and projection['horizon_days'] > 0:
+            UI.section("PROJECTION")
+            chance = projection['probability_by_date'] * 100
+            chance_color = Colors.GREEN if chance >= 50 else Colors.YELLOW if chance >= 20 else Colors.RED
+            UI.info("Chance by date", f"{chance:.1f}%", chance_color)
+            low, median, high = (projection['percentiles'][key] for key in ('p5', 'p50', 'p95'))
+            UI.info("Median outcome", f"{symbol}{median:,.2f}")
+            UI.info("5% - 95% range", f"{symbol}{low:,.2f} - {symbol}{high:,.2f}", Colors.GRAY)
+            if projection['no_history']:
+                UI.write(f"{Colors.GRAY}  Held at today's value (no local history): "
+                         f"{', '.join(projection['no_history'])}{Colors.RESET}")
+        
+        rows, performance = self.performance_report()
+        if rows:
+            UI.section("PERFORMANCE")
+            for label, key in (("Time-weighted", 'twr'), ("Money-weighted p.a.", 'mwr')):
+                if performance[key] is not None:
+                    color = Colors.GREEN if performance[key] >= 0 else Colors.RED
+                    UI.info(label, f"{performance[key] * 100:+.2f}%", color)
+            if performance['volatility'] is not None:
+                UI.info("Volatility p.a.", f"{performance['volatility'] * 100:.2f}%")
+            UI.info("Max drawdown", f"{performance['max_drawdown'] * 100:.2f}%  "
+                    f"({performance['drawdown_peak']} → {performance['drawdown_trough']})", Colors.RED)
+            if performance['days_missing_prices']:
+                UI.write(f"{Colors.GRAY}  {performance['days_missing_prices']} days lack local prices; "
+                         f"see the 'history --backfill' command{Colors.RESET}")
+        
         UI.space(2)
 
 
+class PortfolioWatch:
+    """Live portfolio view: a background thread refreshes prices, the screen redraws changed lines only"""
+    
+    def __init__(self, tracker: 'CryptoTracker', interval: float = WATCH_INTERVAL):
+        self.tracker = tracker
+        self.interval = interval
+        self.stop = threading.Event()
+        self.updated = threading.Event()
+        self._lock = threading.Lock()
+        self._valuation: Optional[PortfolioValuation] = None
+        self._refreshed_at: Optional[datetime] = None
+        self._screen: List[str] = []
+        self.out = sys.stdout
+    
+    def _refresh_loop(self):
+        while not self.stop.is_set():
+            # Any UI messages land in the frame buffer, which the next screen discards
+            valuation = self.tracker.value_portfolio(refresh=True)
+            with self._lock:
+                self._valuation = valuation
+                self._refreshed_at = datetime.now()
+            self.updated.set()
+            self.stop.wait(self.interval)
+    
+    def _wait_for_enter(self):
+        sys.stdin.readline()
+        self.stop.set()
+        self.updated.set()
+    
+    def render(self, valuation: PortfolioValuation, refreshed_at: datetime) -> List[str]:
+        symbol = self.tracker.get_currency_symbol()
+        width, height = shutil.get_terminal_size((80, 24))
+        lines = [
+            f"{Colors.BOLD}{Colors.WHITE}{'LIVE PORTFOLIO (' + self.tracker.get_currency_name() + ')':<40}{Colors.RESET}"
+            f"{Colors.GRAY}updated {refreshed_at.strftime('%H:%M:%S')}, every {self.interval:g}s{Colors.RESET}",
+            f"{Colors.GRAY}{'COIN':<12}{'PRICE':>16}{'VALUE':>18}{'P/L %':>10}{'24H %':>9}{Colors.RESET}"
+        ]
+        
+        rows = valuation.rows()
+        visible = max(0, height - 7)
+        for data in rows[:visible]:
+            pl_color = Colors.GREEN if data['profit'] >= 0 else Colors.RED
+            change_color = Colors.GREEN if data['change_24h'] >= 0 else Colors.RED
+            lines.append(
+                f"{Colors.WHITE}{data['id'].upper()[:11]:<12}{Colors.RESET}"
+                f"{symbol + format(data['current_price'], ',.2f'):>16}"
+                f"{symbol + format(data['value'], ',.2f'):>18}"
+                f"{pl_color}{data['profit_pct']:>+10.2f}{Colors.RESET}"
+                f"{change_color}{data['change_24h']:>+9.2f}{Colors.RESET}")
+        if len(rows) > visible:
+            lines.append(f"{Colors.GRAY}... {len(rows) - visible} more{Colors.RESET}")
+        
+        total_color = Colors.GREEN if valuation.total_profit >= 0 else Colors.RED
+        lines.append(f"{Colors.GRAY}{UI.line('─', min(width, 65))}{Colors.RESET}")
+        lines.append(f"{Colors.BOLD}{Colors.WHITE}{'TOTAL':<12}{Colors.RESET}{'':>16}"
+                     f"{symbol + format(valuation.total_value, ',.2f'):>18}"
+                     f"{total_color}{valuation.total_profit_pct:>+10.2f}{Colors.RESET}"
+                     f"{valuation.total_change_24h_pct:>+9.2f}")
+        lines.append(f"{Colors.GRAY}Press Enter to return{Colors.RESET}")
+        return lines
+    
+    def draw(self, lines: List[str]):
+        # Move the cursor only to rows whose text changed, then clear the rest of that row
+        out = []
+        for row, line in enumerate(lines, 1):
+            if row > len(self._screen) or self._screen[row - 1] != line:
+                out.append(f"\033[{row};1H{line}\033[K")
+        if len(lines) < len(self._screen):
+            out.append(f"\033[{len(lines) + 1};1H\033[J")
+        self._screen = lines
+        self.out.write(''.join(out))
+        self.out.flush()
+    
+    def run(self):
+        UI.clear()
+        self.out = sys.stdout
+        self.out.write("\033[?25l\033[H\033[2J")
+        self.out.flush()
+        threading.Thread(target=self._refresh_loop, daemon=True).start()
+        threading.Thread(target=self._wait_for_enter, daemon=True).start()
+        try:
+            while not self.stop.is_set():
+                self.updated.wait()
+                self.updated.clear()
+                with self._lock:
+                    valuation, refreshed_at = self._valuation, self._refreshed_at
+                if valuation is not None and not self.stop.is_set():
+                    self.draw(self.render(valuation, refreshed_at))
+        finally:
+            self.stop.set()
+            self.out.write("\033[?25h\n")
+            self.out.flush()
+
+
+class TrackerServer:
+    """JSON HTTP API over one shared CryptoTracker, for internal tools.
+    
+    Requests run on their own threads but share the tracker's price cache, HTTP pool
+    and rate limiter; identical price lookups already in flight are coalesced, and
+    writes are serialized. Every endpoint takes an optional `portfolio` name.
+    
+        GET    /health
+        GET    /prices?ids=bitcoin,eth[&currency=eur]
+        GET    /portfolio[?portfolio=name&currency=eur&refresh=1]
+        GET    /portfolios[?names=a,b]
+        POST   /holdings          {"id": "bitcoin", "amount": 0.5, "price": 42000}
+        DELETE /holdings/<id>[?amount=0.1&price=45000]
+        GET    /goals[?project=1&paths=20000]
+        GET    /stats
+    """
+    
+    def __init__(self, tracker: 'CryptoTracker', host: str = '127.0.0.1', port: int = SERVER_PORT):
+        self.tracker = tracker
+        self._write_lock = threading.Lock()
+        api = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                api.dispatch(self, 'GET')
+            
+            def do_POST(self):
+                api.dispatch(self, 'POST')
+            
+            def do_DELETE(self):
+                api.dispatch(self, 'DELETE')
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+    
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def dispatch(self, request: BaseHTTPRequestHandler, method: str):
+        url = urlparse(request.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            with METRICS.timer(f"serve {method} /{parts[0] if parts else ''}"):
+                status, body = self.route(method, parts, query, request)
+        except (KeyError, ValueError, TypeError) as e:
+            status, body = 400, {'error': f"bad request: {e}"}
+        except Exception as e:
+            status, body = 500, {'error': str(e)}
+        finally:
+            # Status messages meant for the terminal go to the server log instead
+            UI.flush()
+        
+        payload = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+    
+    def route(self, method: str, parts: List[str], query: Dict, request) -> Tuple[int, Dict]:
+        tracker = self.tracker
+        resource = parts[0] if parts else ''
+        currency = query.get('currency', tracker.currency).lower()
+        portfolio = check_portfolio_name(query.get('portfolio', tracker.portfolio_name))
+        
+        if method == 'GET' and resource == 'health':
+            return 200, {'ok': True, 'offline': tracker.offline, 'portfolio': tracker.portfolio_name}
+        
+        if method == 'GET' and resource == 'prices':
+            crypto_ids = [self.resolve(text) for text in query['ids'].split(',') if text]
+            prices = tracker.get_prices(crypto_ids, query.get('refresh') == '1', currency)
+            return 200, {'currency': currency, 'prices': prices,
+                         'missing': [crypto_id for crypto_id in crypto_ids if crypto_id not in prices]}
+        
+        if method == 'GET' and resource == 'portfolio':
+            holdings = self.snapshot(portfolio)
+            prices = tracker.get_prices(list(holdings), query.get('refresh') == '1', currency)
+            valuation = PortfolioValuation.from_prices(holdings, prices, currency)
+            return 200, dict(valuation.summary(), portfolio=portfolio, offline=tracker.offline,
+                             holdings=valuation.rows())
+        
+        if method == 'GET' and resource == 'portfolios':
+            names = [name for name in query.get('names', '').split(',') if name] or tracker.list_portfolios()
+            holdings = {name: self.snapshot(name) for name in names}
+            crypto_ids = list(dict.fromkeys(crypto_id for portfolio in holdings.values() for crypto_id in portfolio))
+            rollup = PortfolioRollup(holdings, tracker.get_prices(crypto_ids, currency=currency), currency)
+            return 200, dict(rollup.summary(), offline=tracker.offline, holdings=rollup.combined.rows())
+        
+        if method == 'POST' and resource == 'holdings':
+            data = json.loads(request.rfile.read(int(request.headers.get('Content-Length') or 0)) or b'{}')
+            crypto_id = self.resolve(str(data['id']))
+            portfolio = check_portfolio_name(data.get('portfolio', portfolio))
+            amount = self.positive(data['amount'], 'amount')
+            price = self.positive(data['price'], 'price') if data.get('price') is not None else None
+            # Same checks as add_holding, but the lookup happens before taking the write lock
+            quote = tracker.get_price(crypto_id)
+            if not quote:
+                return 404, {'error': "unknown coin or no price data", 'id': crypto_id}
+            if price is None:
+                if quote.get('stale'):
+                    return 409, {'error': "only a stale price is available; pass a price", 'id': crypto_id}
+                price = quote['price']
+            with self._write_lock:
+                tracker.record_transaction(TransactionLedger.make('buy', crypto_id, amount, price), portfolio)
+                holding = dict(tracker.holdings(portfolio)[crypto_id])
+                error = self.save()
+            if error:
+                return 500, {'error': f"applied but not saved: {error}", 'id': crypto_id}
+            return 201, {'portfolio': portfolio, 'id': crypto_id, 'holding': holding}
+        
+        if method == 'DELETE' and resource == 'holdings' and len(parts) == 2:
+            crypto_id = self.resolve(parts[1])
+            amount = self.positive(query['amount'], 'amount') if 'amount' in query else None
+            price = self.positive(query['price'], 'price') if 'price' in query else None
+            with self._write_lock:
+                ok = tracker.remove_holding(crypto_id, amount, price, portfolio)
+                remaining = tracker.holdings(portfolio).get(crypto_id, {}).get('amount', 0)
+                error = self.save() if ok else None
+            if not ok:
+                return 404, {'error': "not in portfolio", 'id': crypto_id}
+            if error:
+                return 500, {'error': f"applied but not saved: {error}", 'id': crypto_id}
+            return 200, {'portfolio': portfolio, 'id': crypto_id, 'remaining': remaining}
+        
+        if method == 'GET' and resource == 'goals':
+            holdings = self.snapshot(portfolio)
+            prices = tracker.get_prices(list(holdings), currency=currency)
+            valuation = PortfolioValuation.from_prices(holdings, prices, currency)
+            progress = dict(tracker.goal_progress(valuation.total_value), currency=currency)
+            if query.get('project') == '1' and portfolio == tracker.portfolio_name:
+                paths = min(int(query.get('paths', PROJECTION_PATHS)), PROJECTION_PATHS)
+                progress['projection'] = tracker.project_goal(paths, valuation=valuation)
+            return 200, progress
+        
+        if method == 'GET' and resource == 'stats':
+            return 200, {'price_flight': tracker.flight.stats(), 'price_cache': tracker.price_cache.stats(),
+                         'http': tracker.http.stats(), 'fetcher': tracker.fetcher.stats()}
+        
+        return 404, {'error': f"no route for {method} {request.path}"}
+    
+    def snapshot(self, portfolio: str) -> Dict:
+        # Copies taken under the write lock; prices are then looked up without holding it
+        with self._write_lock:
+            return {crypto_id: dict(holding) for crypto_id, holding in self.tracker.holdings(portfolio).items()}
+    
+    def resolve(self, text: str) -> str:
+        return self.tracker.resolve_coin(text, wait=True)
+    
+    @staticmethod
+    def positive(value, name: str) -> float:
+        # float() accepts 'nan' and 'inf', which would reach the ledger and break JSON responses
+        number = float(value)
+        if not (math.isfinite(number) and number > 0):
+            raise ValueError(f"{name} must be a positive number")
+        return number
+    
+    def save(self) -> Optional[str]:
+        # Writes are flushed before a change is acknowledged; returns the error if that failed
+        try:
+            self.tracker.flush()
+        except (OSError, sqlite3.Error) as e:
+            return str(e)
+        return None
+    
+    def start(self) -> 'TrackerServer':
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+    
+    def serve_forever(self):
+        self.server.serve_forever()
+    
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
 def show_menu():
     UI.clear()
     UI.header("CRYPTO TRACKER")
@@ -525,6 +3743,8 @@ def show_menu():
     UI.menu_item(6, "Currency", "Switch USD/INR/EUR/GBP")
     UI.menu_item(7, "Set Goals", "Set investment targets")
     UI.menu_item(8, "View Goals", "Check goal progress")
+    UI.menu_item('W', "Watch", "Live auto-refreshing portfolio")
+    UI.menu_item('P', "Portfolios", "Switch account, see all combined")
     UI.menu_item(9, "Exit", "Save and quit")
     
     UI.space()
@@ -543,14 +3763,14 @@ def add_crypto_flow(tracker: CryptoTracker):
     
     if not results:
         UI.error("No results found")
-        time.sleep(1.5)
+        UI.pause(1.5)
         return
     
-    print()
+    UI.write()
     for i, coin in enumerate(results, 1):
-        print(f"{Colors.GRAY}{i}.{Colors.RESET} {Colors.WHITE}{coin['name']}{Colors.RESET} {Colors.GRAY}{coin['symbol'].upper()}{Colors.RESET}")
+        UI.write(f"{Colors.GRAY}{i}.{Colors.RESET} {Colors.WHITE}{coin['name']}{Colors.RESET} {Colors.GRAY}{coin['symbol'].upper()}{Colors.RESET}")
     
-    print()
+    UI.write()
     choice = UI.prompt("Select (1-5)")
     
     try:
@@ -558,26 +3778,29 @@ def add_crypto_flow(tracker: CryptoTracker):
         if 0 <= idx < len(results):
             crypto_id = results[idx]['id']
             
-            print()
+            UI.write()
             price_data = tracker.get_price(crypto_id)
             symbol = tracker.get_currency_symbol()
             if price_data:
-                print(f"{Colors.GRAY}Current price: {symbol}{price_data['price']:,.2f}{Colors.RESET}\n")
+                UI.write(f"{Colors.GRAY}Current price: {symbol}{price_data['price']:,.2f}{Colors.RESET}\n")
             
             amount = float(UI.prompt("Amount"))
             
             use_current = UI.prompt("Use current price? (y/n)").lower()
             
             if use_current == 'y':
-                tracker.add_holding(crypto_id, amount)
+                # Record the price just shown rather than looking it up again
+                fresh = price_data and not price_data.get('stale')
+                tracker.add_holding(crypto_id, amount, price_data['price'] if fresh else None)
             else:
                 purchase_price = float(UI.prompt(f"Purchase price {symbol}"))
                 tracker.add_holding(crypto_id, amount, purchase_price)
+            tracker.save_changes()
             
-            time.sleep(1.5)
+            UI.pause(1.5)
     except ValueError:
         UI.error("Invalid input")
-        time.sleep(1.5)
+        UI.pause(1.5)
 
 
 def remove_crypto_flow(tracker: CryptoTracker):
@@ -585,16 +3808,16 @@ def remove_crypto_flow(tracker: CryptoTracker):
     UI.header("REMOVE CRYPTO")
     
     if not tracker.portfolio:
-        print(f"{Colors.GRAY}No holdings to remove{Colors.RESET}")
-        time.sleep(1.5)
+        UI.write(f"{Colors.GRAY}No holdings to remove{Colors.RESET}")
+        UI.pause(1.5)
         return
     
-    print()
+    UI.write()
     for i, crypto_id in enumerate(tracker.portfolio.keys(), 1):
         amount = tracker.portfolio[crypto_id]['amount']
-        print(f"{Colors.GRAY}{i}.{Colors.RESET} {Colors.WHITE}{crypto_id.upper()}{Colors.RESET} {Colors.GRAY}({amount:.8f}){Colors.RESET}")
+        UI.write(f"{Colors.GRAY}{i}.{Colors.RESET} {Colors.WHITE}{crypto_id.upper()}{Colors.RESET} {Colors.GRAY}({amount:.8f}){Colors.RESET}")
     
-    print()
+    UI.write()
     choice = UI.prompt("Select")
     
     try:
@@ -608,25 +3831,68 @@ def remove_crypto_flow(tracker: CryptoTracker):
         else:
             amount = float(amount_input)
             tracker.remove_holding(crypto_id, amount)
+        tracker.save_changes()
         
-        time.sleep(1.5)
+        UI.pause(1.5)
     except (ValueError, IndexError):
         UI.error("Invalid input")
-        time.sleep(1.5)
+        UI.pause(1.5)
+
+
+def portfolios_flow(tracker: CryptoTracker):
+    UI.clear()
+    UI.header(f"PORTFOLIOS ({tracker.get_currency_name()})")
+    
+    rollup = tracker.rollup()
+    symbol = tracker.get_currency_symbol()
+    for data in rollup.rows():
+        marker = "*" if data['portfolio'] == tracker.portfolio_name else " "
+        pl_color = Colors.GREEN if data['profit'] >= 0 else Colors.RED
+        UI.write(f"{Colors.WHITE}{marker} {data['portfolio'][:20]:<20}{Colors.RESET}"
+                 f"{symbol + format(data['value'], ',.2f'):>16}"
+                 f"{pl_color}{data['profit_pct']:>+9.2f}%{Colors.RESET}"
+                 f"{Colors.GRAY}{data['weight'] * 100:>7.1f}%{Colors.RESET}")
+    
+    combined = rollup.combined
+    total_color = Colors.GREEN if combined.total_profit >= 0 else Colors.RED
+    UI.divider()
+    UI.write(f"{Colors.BOLD}{Colors.WHITE}  {'ALL':<20}{Colors.RESET}"
+             f"{symbol + format(combined.total_value, ',.2f'):>16}"
+             f"{total_color}{combined.total_profit_pct:>+9.2f}%{Colors.RESET}")
+    if rollup.unpriced:
+        UI.write(f"{Colors.GRAY}  Unpriced: {', '.join(rollup.unpriced)}{Colors.RESET}")
+    
+    UI.write()
+    name = UI.prompt("Switch to (name, new name, or Enter to go back)")
+    if name:
+        try:
+            tracker.switch_portfolio(name)
+            UI.success(f"Now using portfolio '{name}'")
+        except ValueError as e:
+            UI.error(str(e))
+        UI.pause(1)
 
 
 def price_check_flow(tracker: CryptoTracker):
     UI.clear()
     UI.header("PRICE CHECK")
     
-    crypto_id = UI.prompt("Enter crypto ID").lower()
-    if crypto_id:
-        tracker.quick_price(crypto_id)
+    query = UI.prompt("Enter crypto ID or symbol")
+    if query:
+        tracker.quick_price(tracker.resolve_coin(query))
         UI.prompt("\nPress Enter to continue")
 
 
 def main():
-    tracker = CryptoTracker()
+    UI.configure()
+    METRICS.enabled = bool(os.environ.get(METRICS_ENV))
+    tracker = CryptoTracker(open_storage(os.environ.get('CRYPTO_TRACKER_DB')))
+    tracker.refresh_coin_index()
+    if os.environ.get(STREAM_ENV):
+        tracker.attach_stream(StreamingSource(os.environ[STREAM_ENV]).start())
+    if tracker.recovery_reported:
+        # The menu clears the screen; keep startup recovery notes up until they are read
+        UI.prompt("Press Enter to continue")
     
     while True:
         show_menu()
@@ -659,25 +3925,350 @@ def main():
             tracker.view_goals()
             UI.prompt("Press Enter to continue")
         
+        elif choice.lower() == 'w':
+            if tracker.portfolio:
+                PortfolioWatch(tracker, STREAM_WATCH_INTERVAL if tracker.stream else WATCH_INTERVAL).run()
+            else:
+                UI.error("No holdings yet")
+                UI.pause(1.5)
+        
+        elif choice.lower() == 'p':
+            portfolios_flow(tracker)
+        
         elif choice == '9':
+            tracker.save_portfolio()
             UI.clear()
-            print()
-            print(f"{Colors.GRAY}{'Portfolio saved'.center(60)}{Colors.RESET}")
-            print()
+            UI.write()
+            UI.write(f"{Colors.GRAY}{'Portfolio saved'.center(60)}{Colors.RESET}")
+            UI.write()
+            UI.flush()
             break
         
         else:
             UI.error("Invalid choice")
-            time.sleep(1)
+            UI.pause(1)
+
+
+def write_output(rows: List[Dict], fmt: str, document=None):
+    """Write rows to stdout as CSV, or `document` (default: rows) as JSON"""
+    if fmt == 'csv':
+        if rows:
+            writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0].keys()), lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        json.dump(rows if document is None else document, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+def portfolio_arg(text: str) -> str:
+    try:
+        return check_portfolio_name(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='crypto_tracker', description="Crypto portfolio tracker")
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help="output format")
+    parser.add_argument('--currency', help="quote currency for this run (usd, inr, eur, gbp)")
+    parser.add_argument('--db', default=os.environ.get('CRYPTO_TRACKER_DB'),
+                        help="use a SQLite database instead of JSON files (env: CRYPTO_TRACKER_DB)")
+    parser.add_argument('--portfolio', type=portfolio_arg, default=DEFAULT_PORTFOLIO, help="portfolio name")
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=os.environ.get(FSYNC_ENV),
+                        help=f"durability of writes (default: snapshots; env: {FSYNC_ENV})")
+    parser.add_argument('--stream', default=os.environ.get(STREAM_ENV),
+                        help=f"live tick feed (tcp://host:port) served before polling (env: {STREAM_ENV})")
+    parser.add_argument('--profile', action='store_true', help="collect timings and print metrics to stderr")
+    parser.add_argument('--metrics-file', default=os.environ.get(METRICS_ENV),
+                        help=f"write metrics here (.json or Prometheus text; env: {METRICS_ENV})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    commands.add_parser('portfolio', help="value all holdings")
+    
+    portfolios = commands.add_parser('portfolios', help="value several portfolios together")
+    portfolios.add_argument('names', nargs='*', type=portfolio_arg, help="portfolios to include (default: all)")
+    portfolios.add_argument('--combined', action='store_true', help="list merged holdings per coin instead")
+    
+    price = commands.add_parser('price', help="look up current prices")
+    price.add_argument('ids', nargs='+', help="CoinGecko coin ids or ticker symbols")
+    
+    add = commands.add_parser('add', help="add to a holding")
+    add.add_argument('id', help="coin id or symbol")
+    add.add_argument('amount', type=float)
+    add.add_argument('--price', type=float, help="purchase price (defaults to current)")
+    
+    remove = commands.add_parser('remove', help="remove from a holding")
+    remove.add_argument('id', help="coin id or symbol")
+    remove.add_argument('--amount', type=float, help="amount to remove (defaults to all)")
+    remove.add_argument('--price', type=float, help="sale price to record in the ledger")
+    
+    goals = commands.add_parser('goals', help="show investment goal progress")
+    goals.add_argument('--project', action='store_true', help="estimate the chance of reaching the target by Monte Carlo")
+    goals.add_argument('--paths', type=int, default=PROJECTION_PATHS, help="simulated paths")
+    goals.add_argument('--workers', type=int, default=1, help="processes to spread the simulation over")
+    goals.add_argument('--seed', type=int, help="random seed for reproducible projections")
+    goals.add_argument('--backfill', action='store_true', help="fetch a year of price history for holdings first")
+    
+    trades = commands.add_parser('import', help="import an exchange trade history export")
+    trades.add_argument('file', help="CSV, JSON Lines or JSON array of trades")
+    trades.add_argument('--type', choices=['csv', 'jsonl', 'json'], help="file type (default: from the extension)")
+    
+    history = commands.add_parser('history', help="show locally recorded price history")
+    history.add_argument('id', help="coin id or symbol")
+    history.add_argument('--days', type=int, default=30, help="how far back to show")
+    history.add_argument('--backfill', action='store_true', help="fetch missing history from the API first")
+    
+    performance = commands.add_parser('performance', help="daily value, TWR/MWR, volatility and drawdowns")
+    performance.add_argument('--start', help="first day, YYYY-MM-DD (default: first transaction)")
+    performance.add_argument('--end', help="last day, YYYY-MM-DD (default: today)")
+    performance.add_argument('--backfill', action='store_true', help="fetch missing price history from the API first")
+    
+    alerts = commands.add_parser('alerts', help="manage and watch price alerts")
+    alert_commands = alerts.add_subparsers(dest='alert_command', required=True)
+    alert_commands.add_parser('list', help="show active alerts")
+    alert_add = alert_commands.add_parser('add', help="add an alert")
+    alert_add.add_argument('target', help="coin id/symbol, or 'total' for portfolio value")
+    bound = alert_add.add_mutually_exclusive_group(required=True)
+    bound.add_argument('--above', type=float, help="fire when the value rises to this level")
+    bound.add_argument('--below', type=float, help="fire when the value falls to this level")
+    bound.add_argument('--move', type=float, help="fire on a move of this many percent from now")
+    alert_remove = alert_commands.add_parser('remove', help="delete an alert")
+    alert_remove.add_argument('id')
+    alert_watch = alert_commands.add_parser('watch', help="poll prices and deliver alerts as they fire")
+    alert_watch.add_argument('--interval', type=float, default=ALERT_INTERVAL, help="seconds between polls")
+    alert_watch.add_argument('--once', action='store_true', help="check once and exit")
+    alert_watch.add_argument('--sink', action='append',
+                             help="stdout, file:PATH or a webhook URL (repeatable, default stdout)")
+    
+    serve = commands.add_parser('serve', help="run the local JSON HTTP API")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=SERVER_PORT)
+    
+    replay = commands.add_parser('replay', help="serve a recorded tick file as a live feed for --stream")
+    replay.add_argument('file', help="one JSON tick per line")
+    replay.add_argument('--host', default='127.0.0.1')
+    replay.add_argument('--port', type=int, default=8765)
+    replay.add_argument('--speed', type=float, default=1.0, help="playback speed; 0 sends as fast as possible")
+    replay.add_argument('--loop', action='store_true', help="start over at the end of the file")
+    
+    migrate = commands.add_parser('migrate', help="copy JSON files into the --db SQLite database")
+    migrate.add_argument('--from-dir', default='.', help="directory holding the JSON files")
+    return parser
+
+
+def open_storage(db_path: Optional[str], fsync: Optional[str] = None):
+    fsync = fsync or os.environ.get(FSYNC_ENV) or 'snapshots'
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError(f"{FSYNC_ENV} must be one of {', '.join(FSYNC_POLICIES)}")
+    return SqliteStorage(db_path, fsync) if db_path else JsonStorage(fsync=fsync)
+
+
+def run_cli(argv: List[str]) -> int:
+    """Non-interactive entry point: prints JSON/CSV to stdout, messages to stderr"""
+    args = build_parser().parse_args(argv)
+    UI.configure(color=False)
+    METRICS.enabled = args.profile or bool(args.metrics_file)
+    try:
+        return _run_command(args)
+    finally:
+        if args.metrics_file:
+            METRICS.dump(args.metrics_file)
+        elif args.profile:
+            sys.stderr.write(METRICS.to_prometheus())
+
+
+def _run_command(args) -> int:
+    
+    if args.command == 'migrate':
+        if not args.db:
+            print("migrate needs --db", file=sys.stderr)
+            return 2
+        counts = SqliteStorage(args.db).migrate_from(JsonStorage(args.from_dir))
+        write_output([counts], args.format)
+        return 0
+    
+    if args.command == 'replay':
+        server = ReplayServer(args.file, args.host, args.port, args.speed, args.loop)
+        print(f"Replaying {args.file} on {server.url}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server.server_close()
+        return 0
+    
+    # Keep stdout clean for machine-readable output
+    stdout = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        tracker = CryptoTracker(open_storage(args.db, args.fsync), args.portfolio)
+        if args.stream:
+            tracker.attach_stream(StreamingSource(args.stream).start())
+            if tracker.stream.connected.wait(HTTP_CONNECT_TIMEOUT) and args.command != 'price':
+                tracker.stream.wait_for(list(tracker.portfolio), tracker.currency)
+        if args.currency:
+            tracker.currency = args.currency.lower()
+        
+        if args.command == 'portfolio':
+            valuation = tracker.value_portfolio()
+            rows = valuation.rows()
+            result = (rows, dict(valuation.summary(), totals=tracker.portfolio_totals(), offline=tracker.offline,
+                                 holdings=rows))
+            ok = not valuation.unpriced
+        
+        elif args.command == 'serve':
+            tracker.refresh_coin_index()
+            server = TrackerServer(tracker, args.host, args.port)
+            UI.success(f"Serving on {server.url}")
+            UI.flush()
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server.server_close()
+                tracker.flush()
+            return 0
+        
+        elif args.command == 'portfolios':
+            rollup = tracker.rollup(args.names or None)
+            per_coin = rollup.combined.rows()
+            rows = per_coin if args.combined else rollup.rows()
+            result = (rows, dict(rollup.summary(), offline=tracker.offline, holdings=per_coin))
+            ok = not rollup.unpriced
+        
+        elif args.command == 'price':
+            crypto_ids = [tracker.resolve_coin(text, wait=True) for text in args.ids]
+            if tracker.stream and tracker.stream.connected.is_set():
+                tracker.stream.wait_for(crypto_ids, tracker.currency)
+            prices = tracker.get_prices(crypto_ids)
+            rows = [{'id': crypto_id, 'currency': tracker.currency, 'price': quote['price'],
+                     'change_24h': quote['change_24h'], 'market_cap': quote['market_cap'],
+                     'quote_age': quote.get('age')} for crypto_id, quote in prices.items()]
+            result = (rows, None)
+            ok = len(prices) == len(set(crypto_ids))
+        
+        elif args.command == 'add':
+            crypto_id = tracker.resolve_coin(args.id, wait=True)
+            ok = tracker.add_holding(crypto_id, args.amount, args.price) and tracker.save_changes()
+            holding = dict(id=crypto_id, **tracker.portfolio[crypto_id]) if ok else {'id': crypto_id}
+            result = ([holding], {'ok': ok, 'holding': holding})
+        
+        elif args.command == 'remove':
+            crypto_id = tracker.resolve_coin(args.id, wait=True)
+            ok = tracker.remove_holding(crypto_id, args.amount, args.price) and tracker.save_changes()
+            remaining = tracker.portfolio.get(crypto_id, {}).get('amount', 0)
+            row = {'id': crypto_id, 'remaining': remaining}
+            result = ([row], {'ok': ok, **row})
+        
+        elif args.command == 'import':
+            try:
+                report = tracker.import_trades(args.file, args.type)
+                ok = True
+            except (OSError, ValueError) as e:
+                UI.error(f"Import failed: {e}")
+                report, ok = {'error': str(e)}, False
+            rows = [{key: value for key, value in report.items() if key != 'unknown_symbols'}]
+            result = (rows, report)
+        
+        elif args.command == 'history':
+            crypto_id = tracker.resolve_coin(args.id, wait=True)
+            if args.backfill:
+                tracker.backfill_history(crypto_id, args.days)
+            ts, values = tracker.history.series(crypto_id, tracker.currency, start=time.time() - args.days * 86400)
+            rows = [{'timestamp': datetime.fromtimestamp(stamp).isoformat(timespec='seconds'), 'price': price}
+                    for stamp, price in zip(ts.tolist(), values.tolist())]
+            result = (rows, None)
+            ok = bool(rows)
+        
+        elif args.command == 'performance':
+            if args.backfill:
+                txns = tracker.transactions()
+                if txns:
+                    first = min(txn['timestamp'] for txn in txns)
+                    days = (datetime.now() - datetime.fromisoformat(first[:10])).days + 1
+                    for crypto_id in sorted({txn['id'] for txn in txns}):
+                        tracker.backfill_history(crypto_id, days)
+            rows, summary = tracker.performance_report(args.start, args.end)
+            result = (rows, dict(summary, daily=rows))
+            ok = bool(rows)
+        
+        elif args.command == 'alerts':
+            ok = True
+            if args.alert_command == 'add':
+                if args.target.lower() == 'total':
+                    coin, reference = PORTFOLIO_KEY, tracker.value_portfolio().total_value if args.move else None
+                else:
+                    coin = tracker.resolve_coin(args.target, wait=True)
+                    quote = tracker.get_price(coin) if args.move else None
+                    reference = quote['price'] if quote else None
+                kind = 'above' if args.above is not None else 'below' if args.below is not None else 'move'
+                threshold = args.above if kind == 'above' else args.below if kind == 'below' else args.move
+                try:
+                    tracker.alerts.add(kind, coin, threshold, tracker.currency, reference)
+                    tracker.save_settings()
+                except ValueError as e:
+                    UI.error(str(e))
+                    ok = False
+            elif args.alert_command == 'remove':
+                ok = tracker.alerts.remove(args.id)
+                tracker.save_settings()
+            elif args.alert_command == 'watch':
+                # Alerts stream to the real stdout while status messages stay on stderr
+                tracker.alerts.sinks = args.sink or ['stdout']
+                tracker.alerts.out = stdout
+                if args.once:
+                    tracker.check_alerts()
+                else:
+                    tracker.watch_alerts(args.interval)
+                UI.flush()
+                return 0
+            rows = tracker.alerts.to_list()
+            result = (rows, None)
+        
+        else:
+            valuation = tracker.value_portfolio() if tracker.portfolio else None
+            progress = tracker.goal_progress(valuation.total_value if valuation else 0)
+            progress['currency'] = tracker.currency
+            ok = True
+            if args.project:
+                if args.backfill:
+                    for crypto_id in tracker.portfolio:
+                        tracker.backfill_history(crypto_id, PROJECTION_LOOKBACK)
+                projection = tracker.project_goal(args.paths, args.workers, args.seed, valuation)
+                if projection is None:
+                    UI.error("Projection needs holdings, a target value and a target date")
+                    ok = False
+                else:
+                    progress['probability_by_date'] = projection['probability_by_date']
+                    progress['projected_median'] = projection['percentiles']['p50']
+                progress_doc = dict(progress, projection=projection)
+            else:
+                progress_doc = progress
+            result = ([progress], progress_doc)
+        
+        tracker.flush()
+        UI.flush()
+    
+    write_output(result[0], args.format, result[1])
+    return 0 if ok else 1
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+    
     try:
         main()
     except KeyboardInterrupt:
         UI.clear()
-        print()
-        print(f"{Colors.GRAY}{'Goodbye'.center(60)}{Colors.RESET}")
-        print()
+        UI.write()
+        UI.write(f"{Colors.GRAY}{'Goodbye'.center(60)}{Colors.RESET}")
+        UI.write()
     except Exception as e:
         UI.error(f"Error: {str(e)}")
+    finally:
+        UI.flush()
+        if METRICS.enabled:
+            METRICS.dump(os.environ[METRICS_ENV])
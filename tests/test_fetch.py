@@ -0,0 +1,172 @@
+"""
+Fetch engine tests: request batching, 429/Retry-After backoff and token-bucket pacing.
+
+Run against the local CoinGecko stub from benchmark.py, so no network access is needed:
+
+    python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import StubCoinGecko, start_stub, stub_price
+from crypto_tracker import (AsyncPriceFetcher, CryptoTracker, JsonStorage, TokenBucket, UI,
+                            BACKOFF_MAX, MAX_IDS_LENGTH, MAX_IDS_PER_REQUEST)
+
+
+class RecordingStub(StubCoinGecko):
+    """The benchmark stub, answering the first `throttle` price requests with a 429"""
+
+    lock = threading.Lock()
+    throttle = 0
+    retry_after = '0'
+    price_requests = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.endswith('/simple/price'):
+            with RecordingStub.lock:
+                RecordingStub.price_requests.append((time.monotonic(), parse_qs(url.query)['ids'][0].split(',')))
+                throttled = RecordingStub.throttle > 0
+                RecordingStub.throttle -= throttled
+            if throttled:
+                body = b'{"error": "rate limited"}'
+                self.send_response(429)
+                self.send_header('Retry-After', RecordingStub.retry_after)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+        super().do_GET()
+
+    @classmethod
+    def reset(cls):
+        cls.throttle = 0
+        cls.retry_after = '0'
+        cls.price_requests = []
+
+
+class StubTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_stub(RecordingStub)
+        cls.api_base = f"http://127.0.0.1:{cls.server.server_address[1]}/api/v3"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        RecordingStub.reset()
+        self.directory = tempfile.TemporaryDirectory()
+        self.tracker = CryptoTracker(JsonStorage(self.directory.name), api_base=self.api_base)
+        self.tracker.currencies = ['usd']
+
+    def tearDown(self):
+        self.tracker.flush()
+        self.tracker.http.close()
+        self.directory.cleanup()
+        UI._frame = []
+
+
+class BatchingTest(StubTestCase):
+    def test_portfolio_is_fetched_in_few_bounded_batches(self):
+        crypto_ids = [f'coin-{i}' for i in range(600)]
+        prices = self.tracker.get_prices(crypto_ids, refresh=True)
+
+        self.assertEqual(set(prices), set(crypto_ids))
+        self.assertEqual(prices['coin-7']['price'], stub_price('coin-7'))
+        batches = [ids for _, ids in RecordingStub.price_requests]
+        self.assertEqual(len(batches), len(list(CryptoTracker._chunk_ids(crypto_ids))))
+        self.assertLess(len(batches), 600 // 100)
+        for ids in batches:
+            self.assertLessEqual(len(ids), MAX_IDS_PER_REQUEST)
+            self.assertLessEqual(len(','.join(ids)), MAX_IDS_LENGTH)
+        self.assertEqual(sorted(crypto_id for ids in batches for crypto_id in ids), sorted(crypto_ids))
+
+    def test_cached_quotes_are_not_fetched_again(self):
+        self.tracker.get_prices(['coin-1', 'coin-2'], refresh=True)
+        self.tracker.get_prices(['coin-1', 'coin-2', 'coin-3'])
+        self.assertEqual([ids for _, ids in RecordingStub.price_requests], [['coin-1', 'coin-2'], ['coin-3']])
+
+
+class BackoffTest(StubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.limiter = TokenBucket(rate=100, capacity=5)
+        self.tracker.fetcher.limiter = self.limiter
+
+    def test_429_is_retried_after_the_servers_retry_after(self):
+        RecordingStub.throttle = 1
+        RecordingStub.retry_after = '0.5'
+        start = time.monotonic()
+        prices = self.tracker.get_prices(['coin-1'], refresh=True)
+
+        self.assertEqual(prices['coin-1']['price'], stub_price('coin-1'))
+        (first, _), (second, _) = RecordingStub.price_requests
+        self.assertGreaterEqual(second - first, 0.5)
+        self.assertLess(time.monotonic() - start, 0.5 + BACKOFF_MAX)
+        stats = self.tracker.fetcher.stats()
+        self.assertEqual((stats['throttled'], stats['retries']), (1, 1))
+
+    def test_429_halves_the_rate_and_success_restores_it(self):
+        RecordingStub.throttle = 1
+        self.tracker.get_prices(['coin-1'], refresh=True)
+        # Halved by the 429, then one additive step back up for the successful retry
+        self.assertAlmostEqual(self.limiter.rate, 100 / 2 + 100 / 10)
+        for i in range(10):
+            self.tracker.get_prices([f'coin-{i + 2}'], refresh=True)
+        self.assertEqual(self.limiter.rate, 100)
+
+    def test_persistent_429_gives_up_after_max_retries(self):
+        RecordingStub.throttle = 100
+        fetcher = AsyncPriceFetcher(get=self.tracker.http.get, limiter=self.limiter, max_retries=2)
+        fetcher._backoff = lambda attempt: 0
+        [error] = fetcher.fetch_all(f"{self.api_base}/simple/price", [{'ids': 'coin-1', 'vs_currencies': 'usd'}])
+
+        self.assertEqual(error.response.status_code, 429)
+        self.assertEqual(len(RecordingStub.price_requests), 3)
+
+    def test_backoff_is_jittered_and_capped(self):
+        for attempt in range(10):
+            delays = [AsyncPriceFetcher._backoff(attempt) for _ in range(50)]
+            self.assertTrue(all(0 <= delay <= BACKOFF_MAX for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+
+class PacingTest(StubTestCase):
+    def test_requests_beyond_the_burst_are_paced_at_the_rate(self):
+        fetcher = AsyncPriceFetcher(get=self.tracker.http.get, limiter=TokenBucket(rate=20, capacity=2), concurrency=4)
+        param_sets = [{'ids': f'coin-{i}', 'vs_currencies': 'usd'} for i in range(8)]
+        results = fetcher.fetch_all(f"{self.api_base}/simple/price", param_sets)
+
+        self.assertEqual([next(iter(data)) for data in results], [f'coin-{i}' for i in range(8)])
+        stamps = sorted(stamp for stamp, _ in RecordingStub.price_requests)
+        # Two go out on the burst; the other six wait for tokens at 20 per second
+        self.assertGreaterEqual(stamps[-1] - stamps[0], 6 / 20 * 0.9)
+        self.assertGreaterEqual(fetcher.last_elapsed, 6 / 20 * 0.9)
+
+    def test_token_bucket_waits_out_retry_after(self):
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.throttled(retry_after=0.2)
+
+        async def acquire():
+            start = time.monotonic()
+            await bucket.acquire()
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(acquire()), 0.2)
+        self.assertEqual(bucket.rate, 500)
+
+
+if __name__ == '__main__':
+    unittest.main()